@@ -1,75 +1,111 @@
+from functools import cached_property, lru_cache
 import random
 from monte_carlo_tree_search import MCTS, Node
+from tictactoe_table import FREE, POWERS, TERMINAL, WINNER, TicTacToeScratch, cells_of
+from zobrist import zobrist_key, zobrist_table
+
+_CELL_VALUE = {" ": 0, "X": 1, "O": 2}  # cell values of tictactoe_table
 
 
 class TicTacToeBoard(Node):
-    def __init__(self, board=None, turn=True, tup=None, **kwargs):
-        self.board = board or [[" "] * 3 for _ in range(3)]
-        self.turn = turn
+    """
+    Immutable tic-tac-toe board. `board` is a tuple of three row tuples;
+    the winner, the terminal flag and the table code are computed once at
+    construction and `tup` on first use, so assigning to a board raises.
+    """
+
+    ZOBRIST = zobrist_table(9, "XO", seed=3)
+
+    def __init__(self, board=None, turn=True, tup=None, key=None, code=None, **kwargs):
+        board = board or ((" ",) * 3,) * 3
         if tup:
             # (True, None, False, False, True, True, None, True, False)
+            board = [list(row) for row in board]
             for i, t in enumerate(tup):
                 sign = " "
                 if t is not None:
                     sign = "X" if t else "O"
                 row = i % 3
                 col = i // 3
-                self.board[row][col] = sign
+                board[row][col] = sign
+        board = tuple(map(tuple, board))  # no copy if already tuples
+        if key is None:
+            key = zobrist_key(self.ZOBRIST, (cell for row in board for cell in row))
+        if code is None:
+            code = sum(_CELL_VALUE[board[i // 3][i % 3]] * POWERS[i] for i in range(9))
+        # Bypass __setattr__, which keeps the board immutable
+        self.__dict__.update(
+            board=board,
+            turn=turn,
+            key=key,  # Zobrist key of the board
+            code=code,  # index into the tictactoe_table tables
+            winner=WINNER[code],
+            terminal=TERMINAL[code],
+        )
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def make_move(self, row, col):
+        "Board after the player to move marks (`row`, `col`)"
+        piece = "X" if self.turn else "O"
+        child_board = list(self.board)
+        cells = child_board[row]
+        child_board[row] = cells[:col] + (piece,) + cells[col + 1 :]
+        key = self.key ^ self.ZOBRIST[3 * row + col][piece]
+        code = self.code + _CELL_VALUE[piece] * POWERS[3 * row + col]
+        return TicTacToeBoard(child_board, not self.turn, key=key, code=code)
 
     def find_children(self):
-        children = set()
-        for row in range(3):
-            for col in range(3):
-                if self.board[row][col] == " ":
-                    child_board = [row[:] for row in self.board]
-                    child_board[row][col] = "X" if self.turn else "O"
-                    children.add(TicTacToeBoard(child_board, not self.turn))
-        return children
+        return {self.make_move(*divmod(i, 3)) for i in FREE[self.code]}
+
+    def iter_children(self):
+        return (self.make_move(*divmod(i, 3)) for i in FREE[self.code])
 
     def find_random_child(self):
-        valid_moves = []
-        for row in range(3):
-            for col in range(3):
-                if self.board[row][col] == " ":
-                    valid_moves.append((row, col))
-        random_row, random_col = random.choice(valid_moves)
-        child_board = [row[:] for row in self.board]
-        child_board[random_row][random_col] = "X" if self.turn else "O"
-        return TicTacToeBoard(child_board, not self.turn)
+        return self.make_move(*divmod(random.choice(FREE[self.code]), 3))
+
+    def move_to(self, child):
+        "Index (3 * row + col) of the cell marked in `child`"
+        for i in range(9):
+            if self.board[i // 3][i % 3] != child.board[i // 3][i % 3]:
+                return i
+        return None
+
+    def scratch(self):
+        return TicTacToeScratch(self.code, self.turn, _board_from_code)
 
     def is_terminal(self):
-        return self.is_winner("X") or self.is_winner("O") or self.is_fully_played()
+        return self.terminal
 
     def reward(self):
         """Rewards depend on who is the current player"""
-        if self.is_winner("X"):
-            return 1
-        elif self.is_winner("O"):
-            return 0
-        else:
+        if self.winner is None:
             return 0.5
+        return 1 if self.winner else 0
 
     def is_winner(self, player):
-        # Check rows, columns, and diagonals for a win
-        for i in range(3):
-            if all(self.board[i][j] == player for j in range(3)):
-                return True
-            if all(self.board[j][i] == player for j in range(3)):
-                return True
-        if all(self.board[i][i] == player for i in range(3)):
-            return True
-        if all(self.board[i][2 - i] == player for i in range(3)):
-            return True
-        return False
+        return self.winner is (player == "X")
 
     def is_fully_played(self):
-        return all(self.board[i][j] != " " for i in range(3) for j in range(3))
+        return not FREE[self.code]
+
+    def encode(self):
+        cells = "".join(cell for row in self.board for cell in row)
+        return (cells + ("X" if self.turn else "O")).encode("ascii")
+
+    @classmethod
+    def decode(cls, data):
+        text = data.decode("ascii")
+        board = [list(text[row * 3 : row * 3 + 3]) for row in range(3)]
+        return cls(board, text[-1] == "X")
 
     def __hash__(self):
-        return hash(str(self.board))
+        return self.key
 
     def __eq__(self, other):
-        return self.board == other.board
+        # Only compare the boards when the keys collide
+        return self.key == other.key and self.board == other.board
 
     def to_pretty_string(self):
         # to_char = lambda v: ("X" if v is True else ("O" if v is False else " "))
@@ -83,21 +119,18 @@ class TicTacToeBoard(Node):
     def __str__(self) -> str:
         return self.to_pretty_string()
 
-    @property
-    def winner(self):
-        if self.is_winner("X"):
-            return True
-        elif self.is_winner("O"):
-            return False
-        else:
-            return None
-
-    @property
+    @cached_property
     def tup(self):
         board_to_tup = {"X": True, "O": False, " ": None}
-        return [
+        return tuple(
             board_to_tup[self.board[row][col]] for col in range(3) for row in range(3)
-        ]
+        )
+
+
+@lru_cache(maxsize=None)  # boards are immutable, so they can be shared
+def _board_from_code(code, turn):
+    marks = [" XO"[value] for value in cells_of(code)]
+    return TicTacToeBoard((marks[0:3], marks[3:6], marks[6:9]), turn, code=code)
 
 
 def new_tic_tac_toe_board():
@@ -113,16 +146,16 @@ def play_game():
         row, col = map(int, row_col.split(","))
         if board.board[row - 1][col - 1] != " ":
             raise RuntimeError("Invalid move")
-        board.board[row - 1][col - 1] = "X"
-        board.turn = not board.turn
+        board = board.make_move(row - 1, col - 1)
+        tree.advance(board)
         print(board.to_pretty_string())
         if board.is_terminal():
             break
         # You can train as you go, or only at the beginning.
-        # Here, we train as we go, doing fifty rollouts each turn.
-        for _ in range(100):
-            tree.do_rollout(board)
+        # Here, we train as we go, doing a hundred rollouts each turn.
+        tree.search(board, rollouts=100)
         board = tree.choose(board)
+        tree.advance(board)
         print(board)
         if board.is_terminal():
             break
@@ -0,0 +1,282 @@
+"""
+Throughput benchmarks for the search engines on the bundled games.
+
+Every case searches one game from its start position, with a fixed seed
+and rollout budget:
+
+    MCTS        ConnectFourGame, BitboardConnectFour and both
+                TicTacToeBoard classes
+    UCTSEARCH   mcts.State, the only game mcts.py can search (it is a
+                single-player game with its own state protocol)
+
+and records rollouts/sec, nodes/sec (tree nodes created per second),
+the peak memory of the search (a separate, traced run, since tracemalloc
+slows the search down) and the time per `choose` (`BESTCHILD` for
+UCTSEARCH).
+
+Timings are noisy, so every search is run `--repeats` times and the
+fastest run is kept, and `choose` is timed with `timeit` over as many
+calls as fill 0.2s, again best of `--repeats`. The relative gap between
+the median and the best run is recorded as the spread of each timing.
+
+    python benchmarks.py --output results.json
+    python benchmarks.py --baseline results.json
+
+The second form reruns the cases, compares them with the stored results
+and exits with status 1 if any metric got worse by more than its
+tolerance: `NOISE_FACTOR` times the larger spread of the two runs, capped
+at `MAX_NOISE_ALLOWANCE` (50%), but at least `--tolerance` (default 10%).
+"""
+import argparse
+import json
+import platform
+import random
+import sys
+import statistics
+import time
+import timeit
+import tracemalloc
+
+# Metrics where higher is better; for the others lower is better
+HIGHER_IS_BETTER = {"rollouts_per_sec", "nodes_per_sec"}
+REPEATS = 5
+# A metric regresses if it got worse by more than this many spreads
+NOISE_FACTOR = 3
+# ... but never by more than this, so a very noisy run still catches slowdowns
+MAX_NOISE_ALLOWANCE = 0.5
+
+
+def _mcts_case(make_root, rollouts):
+    def run():
+        from monte_carlo_tree_search import MCTS
+
+        tree = MCTS()
+        root = make_root()
+        for _ in range(rollouts):
+            tree.do_rollout(root)
+        return tree, root
+
+    def nodes(result):
+        tree, _ = result
+        return len(tree.N)
+
+    def choose(result):
+        tree, root = result
+        return tree.choose(root)
+
+    return run, nodes, choose
+
+
+def _uctsearch_case(rollouts):
+    def run():
+        import mcts
+
+        root = mcts.Node(mcts.State())
+        mcts.UCTSEARCH(rollouts, root)
+        return root
+
+    def nodes(root):
+        count, frontier = 0, [root]
+        while frontier:
+            node = frontier.pop()
+            count += 1
+            frontier.extend(node.children)
+        return count
+
+    def choose(root):
+        import mcts
+
+        return mcts.BESTCHILD(root, 0)
+
+    return run, nodes, choose
+
+
+def _connectfour():
+    from connectfour import ConnectFourGame
+
+    return ConnectFourGame()
+
+
+def _bitboard():
+    from connectfour import BitboardConnectFour
+
+    return BitboardConnectFour()
+
+
+def _tictactoe_chat():
+    from TicTacToeChat import TicTacToeBoard
+
+    return TicTacToeBoard()
+
+
+def _tictactoe():
+    from tictactoe import TicTacToeBoard
+
+    return TicTacToeBoard((None,) * 9, True, None, False)
+
+
+# name -> (rollouts, case)
+CASES = {
+    "mcts/connectfour": (300, lambda n: _mcts_case(_connectfour, n)),
+    "mcts/bitboard_connectfour": (5000, lambda n: _mcts_case(_bitboard, n)),
+    "mcts/tictactoe_chat": (5000, lambda n: _mcts_case(_tictactoe_chat, n)),
+    "mcts/tictactoe": (5000, lambda n: _mcts_case(_tictactoe, n)),
+    "uctsearch/state": (5000, lambda n: _uctsearch_case(n)),
+}
+
+
+def _seed(seed):
+    # The cases draw all their random numbers from `random`, including those
+    # of NumPy generators, which are seeded from it
+    random.seed(seed)
+
+
+def _spread(times):
+    "Relative gap between the median and the best of `times`"
+    best = min(times)
+    return (statistics.median(times) - best) / best if best else 0.0
+
+
+def run_case(name, rollouts=None, seed=0, repeats=REPEATS):
+    """
+    Metrics of one case, with its default budget unless `rollouts` is
+    given, timed as the best of `repeats` runs
+    """
+    default, case = CASES[name]
+    rollouts = rollouts or default
+    run, count_nodes, choose = case(rollouts)
+
+    seconds = []
+    for _ in range(repeats):
+        _seed(seed)
+        start = time.perf_counter()
+        result = run()
+        seconds.append(time.perf_counter() - start)
+    nodes = count_nodes(result)
+
+    timer = timeit.Timer(lambda: choose(result))
+    number, _ = timer.autorange()
+    choose_seconds = [total / number for total in timer.repeat(repeats, number)]
+    del result
+
+    _seed(seed)
+    tracemalloc.start()
+    try:
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    elapsed = min(seconds)
+    return {
+        "rollouts": rollouts,
+        "nodes": nodes,
+        "repeats": repeats,
+        "seconds": elapsed,
+        "rollouts_per_sec": rollouts / elapsed,
+        "nodes_per_sec": nodes / elapsed,
+        "peak_memory_bytes": peak,
+        "choose_seconds": min(choose_seconds),
+        # Relative spread of each timed metric; peak memory is not timed
+        "spread": {
+            "rollouts_per_sec": _spread(seconds),
+            "nodes_per_sec": _spread(seconds),
+            "choose_seconds": _spread(choose_seconds),
+        },
+    }
+
+
+def run_all(names=None, scale=1.0, seed=0, repeats=REPEATS):
+    "Run the cases `names` (all by default), with budgets scaled by `scale`"
+    results = {}
+    for name in names or CASES:
+        rollouts = max(1, int(CASES[name][0] * scale))
+        results[name] = run_case(name, rollouts, seed, repeats)
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "seed": seed,
+        "results": results,
+    }
+
+
+def compare(current, baseline, tolerance=0.1):
+    """
+    Regressions of `current` against `baseline` (both from `run_all`), as a
+    list of (case, metric, baseline value, current value). A metric
+    regresses if it got worse by more than `NOISE_FACTOR` times the larger
+    spread measured for it in either run (at most `MAX_NOISE_ALLOWANCE`),
+    or by more than `tolerance` if that is larger. Cases or metrics missing
+    from either side are skipped.
+    """
+    regressions = []
+    for name, metrics in current["results"].items():
+        old = baseline["results"].get(name)
+        if old is None:
+            continue
+        for metric in sorted(HIGHER_IS_BETTER | {"peak_memory_bytes", "choose_seconds"}):
+            if metric not in metrics or metric not in old or not old[metric]:
+                continue
+            spread = max(
+                metrics.get("spread", {}).get(metric, 0.0),
+                old.get("spread", {}).get(metric, 0.0),
+            )
+            noise = min(NOISE_FACTOR * spread, MAX_NOISE_ALLOWANCE)
+            allowed = max(tolerance, noise)
+            if metric in HIGHER_IS_BETTER:
+                # Rates are inverse times: a rate drops by a factor 1 + x
+                # when its time grows by x
+                worse = metrics[metric] * (1 + allowed) < old[metric]
+            else:
+                worse = metrics[metric] > old[metric] * (1 + allowed)
+            if worse:
+                regressions.append((name, metric, old[metric], metrics[metric]))
+    return regressions
+
+
+def _print_results(report):
+    print(
+        f"{'case':28} {'rollouts/s':>11} {'spread':>7} {'nodes/s':>11}"
+        f" {'peak MB':>8} {'choose us':>10} {'spread':>7}"
+    )
+    for name, m in report["results"].items():
+        spread = m["spread"]
+        print(
+            f"{name:28} {m['rollouts_per_sec']:11.0f} {spread['rollouts_per_sec']:7.1%}"
+            f" {m['nodes_per_sec']:11.0f} {m['peak_memory_bytes'] / 1e6:8.1f}"
+            f" {m['choose_seconds'] * 1e6:10.1f} {spread['choose_seconds']:7.1%}"
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Search engine benchmarks")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare with the results in this JSON file")
+    parser.add_argument(
+        "--tolerance", type=float, default=0.1, help="smallest tolerated slowdown"
+    )
+    parser.add_argument("--repeats", type=int, default=REPEATS, help="runs per timing")
+    parser.add_argument("--cases", nargs="*", choices=sorted(CASES), help="default: all")
+    parser.add_argument("--scale", type=float, default=1.0, help="scale all budgets")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    report = run_all(args.cases, args.scale, args.seed, args.repeats)
+    _print_results(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance)
+        for name, metric, old, new in regressions:
+            print(f"REGRESSION {name} {metric}: {old:.6g} -> {new:.6g}")
+        if regressions:
+            return 1
+        print(f"no regressions beyond the measured noise (at least {args.tolerance:.0%})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,30 +1,55 @@
+import bisect
+import math
 import random
+import struct
 from monte_carlo_tree_search import MCTS, Node
+from zobrist import zobrist_key, zobrist_table
 
 
 class ConnectFourGame(Node):
     NR_COLS = 7
     NR_ROWS = 6
+    # Center columns first, so progressive widening tries them first
+    COL_ORDER = (3, 2, 4, 1, 5, 0, 6)
+    ZOBRIST = zobrist_table(NR_COLS * NR_ROWS, "XO", seed=4)
 
-    def __init__(self, board=None, turn=True):
+    def __init__(self, board=None, turn=True, key=None):
         self.board = board or [[" "] * self.NR_COLS for _ in range(self.NR_ROWS)]
         self.turn = turn
+        if key is None:
+            key = zobrist_key(self.ZOBRIST, (cell for row in self.board for cell in row))
+        self.key = key  # Zobrist key of the board, kept up to date by make_move
+
+    def play(self, col):
+        "Position after the player to move drops a stone into `col`"
+        child_board = [row[:] for row in self.board]
+        row = self._drop(child_board, col)
+        piece = "X" if self.turn else "O"
+        key = self.key ^ self.ZOBRIST[row * self.NR_COLS + col][piece]
+        return ConnectFourGame(child_board, not self.turn, key)
 
     def find_children(self):
-        children = set()
-        for col in range(self.NR_COLS):
-            if self.is_valid_move(col):
-                child_board = [row[:] for row in self.board]
-                child_board = self.make_move(child_board, col)
-                children.add(ConnectFourGame(child_board, not self.turn))
-        return children
+        return {
+            self.play(col) for col in range(self.NR_COLS) if self.is_valid_move(col)
+        }
+
+    def iter_children(self):
+        return (self.play(col) for col in self.COL_ORDER if self.is_valid_move(col))
+
+    def move_to(self, child):
+        for row in range(self.NR_ROWS):
+            for col in range(self.NR_COLS):
+                if self.board[row][col] != child.board[row][col]:
+                    return col
+        return None
+
+    def scratch(self):
+        bitboard = BitboardConnectFour.from_board(self.board, self.turn)
+        return BitboardScratch(bitboard, type(self))
 
     def find_random_child(self):
         valid_moves = [col for col in range(self.NR_COLS) if self.is_valid_move(col)]
-        random_col = random.choice(valid_moves)
-        child_board = [row[:] for row in self.board]
-        child_board = self.make_move(child_board, random_col)
-        return ConnectFourGame(child_board, not self.turn)
+        return self.play(random.choice(valid_moves))
 
     def is_terminal(self):
         return self.is_draw() or self.is_winner("X") or self.is_winner("O")
@@ -41,11 +66,18 @@ class ConnectFourGame(Node):
         return self.board[0][col] == " "
 
     def make_move(self, board, col):
+        row = self._drop(board, col)
+        if board is self.board and row is not None:
+            self.key ^= self.ZOBRIST[row * self.NR_COLS + col][board[row][col]]
+        return board
+
+    def _drop(self, board, col):
+        "Drop a stone into `col` of `board` in place, return the row it lands in"
         for row in range(5, -1, -1):
             if board[row][col] == " ":
                 board[row][col] = "X" if self.turn else "O"
-                break
-        return board
+                return row
+        return None
 
     def is_winner(self, player):
         for row in range(self.NR_ROWS):
@@ -79,11 +111,25 @@ class ConnectFourGame(Node):
     def is_draw(self):
         return all(self.board[0][col] != " " for col in range(self.NR_COLS))
 
+    def encode(self):
+        cells = "".join(cell for row in self.board for cell in row)
+        return (cells + ("X" if self.turn else "O")).encode("ascii")
+
+    @classmethod
+    def decode(cls, data):
+        text = data.decode("ascii")
+        board = [
+            list(text[row * cls.NR_COLS : (row + 1) * cls.NR_COLS])
+            for row in range(cls.NR_ROWS)
+        ]
+        return cls(board, text[-1] == "X")
+
     def __hash__(self):
-        return hash(str(self.board))
+        return self.key
 
     def __eq__(self, other):
-        return self.board == other.board
+        # Only compare the boards when the keys collide
+        return self.key == other.key and self.board == other.board
 
     def to_pretty_string(self):
         # to_char = lambda v: ("X" if v is True else ("O" if v is False else " "))
@@ -103,8 +149,362 @@ class ConnectFourGame(Node):
         return self.to_pretty_string()
 
 
-def play_game():
+class BitboardConnectFour(Node):
+    """
+    Connect Four on two 64-bit bitboards, one per player.
+
+    Bit ``col * 7 + row`` is set when that cell holds a stone, with rows
+    counted from the bottom. The seventh bit of every column is never used,
+    which keeps the shifts in ``_has_four`` from wrapping into the next
+    column. ``heights`` holds the number of stones in each column.
+    """
+
+    NR_COLS = 7
+    NR_ROWS = 6
+    COL_BITS = NR_ROWS + 1
+    BOTTOM = int("0000001" * NR_COLS, 2)  # lowest bit of every column
+
+    def __init__(self, x_bits=0, o_bits=0, turn=True):
+        self.x_bits = x_bits
+        self.o_bits = o_bits
+        self.turn = turn
+        mask = x_bits | o_bits
+        self.heights = tuple(
+            bin((mask >> (col * self.COL_BITS)) & ((1 << self.NR_ROWS) - 1)).count("1")
+            for col in range(self.NR_COLS)
+        )
+        if _has_four(x_bits):
+            self.winner = True
+        elif _has_four(o_bits):
+            self.winner = False
+        else:
+            self.winner = None
+        self.nr_moves = sum(self.heights)
+        self.key = x_bits + mask + self.BOTTOM
+
+    @classmethod
+    def from_board(cls, board, turn=True):
+        "Build a bitboard from a `ConnectFourGame.board` style list of rows"
+        x_bits = o_bits = 0
+        for row in range(cls.NR_ROWS):
+            for col in range(cls.NR_COLS):
+                bit = 1 << (col * cls.COL_BITS + cls.NR_ROWS - 1 - row)
+                if board[row][col] == "X":
+                    x_bits |= bit
+                elif board[row][col] == "O":
+                    o_bits |= bit
+        return cls(x_bits, o_bits, turn)
+
+    def play(self, col):
+        "Position after the player to move drops a stone into `col`"
+        height = self.heights[col]
+        move = 1 << (col * self.COL_BITS + height)
+        child = BitboardConnectFour.__new__(BitboardConnectFour)
+        if self.turn:
+            child.x_bits = self.x_bits | move
+            child.o_bits = self.o_bits
+            child.winner = True if _has_four(child.x_bits) else None
+        else:
+            child.x_bits = self.x_bits
+            child.o_bits = self.o_bits | move
+            child.winner = False if _has_four(child.o_bits) else None
+        child.turn = not self.turn
+        child.heights = self.heights[:col] + (height + 1,) + self.heights[col + 1 :]
+        child.nr_moves = self.nr_moves + 1
+        child.key = child.x_bits + (child.x_bits | child.o_bits) + self.BOTTOM
+        return child
+
+    def valid_moves(self):
+        return [col for col in range(self.NR_COLS) if self.heights[col] < self.NR_ROWS]
+
+    def find_children(self):
+        if self.is_terminal():
+            return set()
+        return {self.play(col) for col in self.valid_moves()}
+
+    def iter_children(self):
+        if self.is_terminal():
+            return iter(())
+        return (
+            self.play(col)
+            for col in ConnectFourGame.COL_ORDER
+            if self.heights[col] < self.NR_ROWS
+        )
+
+    def find_random_child(self):
+        return self.play(random.choice(self.valid_moves()))
+
+    def move_to(self, child):
+        added = (child.x_bits | child.o_bits) & ~(self.x_bits | self.o_bits)
+        return (added.bit_length() - 1) // self.COL_BITS
+
+    def scratch(self):
+        return BitboardScratch(self)
+
+    def is_terminal(self):
+        return self.winner is not None or self.nr_moves == self.NR_COLS * self.NR_ROWS
+
+    def reward(self):
+        if self.winner is None:
+            return 0.5
+        return 1 if self.winner else 0
+
+    def is_valid_move(self, col):
+        return self.heights[col] < self.NR_ROWS
+
+    def is_winner(self, player):
+        return self.winner is (player == "X")
+
+    @property
+    def board(self):
+        "The position as a `ConnectFourGame.board` style list of rows"
+        board = [[" "] * self.NR_COLS for _ in range(self.NR_ROWS)]
+        for col in range(self.NR_COLS):
+            for row in range(self.heights[col]):
+                bit = 1 << (col * self.COL_BITS + row)
+                board[self.NR_ROWS - 1 - row][col] = "X" if self.x_bits & bit else "O"
+        return board
+
+    _ENCODING = struct.Struct("<QQ?")
+
+    def encode(self):
+        return self._ENCODING.pack(self.x_bits, self.o_bits, self.turn)
+
+    @classmethod
+    def decode(cls, data):
+        return cls(*cls._ENCODING.unpack(data))
+
+    def __hash__(self):
+        return self.key
+
+    def __eq__(self, other):
+        return self.key == other.key
+
+    def to_pretty_string(self):
+        return ConnectFourGame.to_pretty_string(self)
+
+    def __str__(self) -> str:
+        return self.to_pretty_string()
+
+
+class BitboardScratch:
+    """
+    Mutable Connect Four position for `MCTS._simulate`, see `Node.scratch`.
+    Moves are columns. `to_node` returns a `node_type` position, either
+    `BitboardConnectFour` or `ConnectFourGame`.
+    """
+
+    def __init__(self, bitboard, node_type=BitboardConnectFour):
+        self.bits = [bitboard.o_bits, bitboard.x_bits]  # indexed by turn
+        self.turn = bitboard.turn
+        self.heights = list(bitboard.heights)
+        self.nr_moves = bitboard.nr_moves
+        self.winner = bitboard.winner
+        self.moves = bitboard.valid_moves()  # kept up to date in place
+        self.node_type = node_type
+        # `threats` cache: bits of each player and their `_threat_cells`
+        self._threat_bits = [None, None]
+        self._threats = [0, 0]
+
+    def legal_moves(self):
+        "The columns that are not full, in increasing order (do not modify)"
+        return self.moves
+
+    def apply_move(self, col):
+        height = self.heights[col]
+        bits = self.bits[self.turn] | 1 << (col * BitboardConnectFour.COL_BITS + height)
+        self.bits[self.turn] = bits
+        if _has_four(bits):
+            self.winner = self.turn
+        self.heights[col] = height + 1
+        if height + 1 == BitboardConnectFour.NR_ROWS:
+            self.moves.remove(col)
+        self.nr_moves += 1
+        self.turn = not self.turn
+
+    def undo_move(self, col):
+        self.turn = not self.turn
+        height = self.heights[col] - 1
+        self.bits[self.turn] &= ~(1 << (col * BitboardConnectFour.COL_BITS + height))
+        if height + 1 == BitboardConnectFour.NR_ROWS:
+            bisect.insort(self.moves, col)
+        self.heights[col] = height
+        self.nr_moves -= 1
+        self.winner = None
+
+    def threats(self, turn):
+        "`_threat_cells` of the player `turn`, recomputed only after they moved"
+        bits = self.bits[turn]
+        if self._threat_bits[turn] != bits:
+            self._threat_bits[turn] = bits
+            self._threats[turn] = _threat_cells(bits)
+        return self._threats[turn]
+
+    def is_terminal(self):
+        max_moves = BitboardConnectFour.NR_COLS * BitboardConnectFour.NR_ROWS
+        return self.winner is not None or self.nr_moves == max_moves
+
+    def reward(self):
+        if self.winner is None:
+            return 0.5
+        return 1 if self.winner else 0
+
+    def to_node(self):
+        node = BitboardConnectFour(self.bits[True], self.bits[False], self.turn)
+        if self.node_type is BitboardConnectFour:
+            return node
+        return self.node_type(node.board, node.turn)
+
+
+def _has_four(bits):
+    "True if `bits` contains four in a row in any direction"
+    for shift in (1, 7, 6, 8):  # vertical, horizontal, and both diagonals
+        pairs = bits & (bits >> shift)
+        if pairs & (pairs >> (2 * shift)):
+            return True
+    return False
+
+
+_CELLS = BitboardConnectFour.BOTTOM * ((1 << BitboardConnectFour.NR_ROWS) - 1)
+
+
+def _threat_cells(bits):
+    "Cells that would give `bits` four in a row, as a bitboard, taken or not"
+    won = (bits << 1) & (bits << 2) & (bits << 3)  # vertical, from below
+    # Horizontal and both diagonals, unrolled: with `up` the stones one step
+    # back along the line and `down` one step ahead, X X X _ or X X _ X
+    # then _ X X X or X _ X X
+    up, down = bits << 7, bits >> 7
+    won |= up & (bits << 14) & ((bits << 21) | down)
+    won |= down & (bits >> 14) & (up | (bits >> 21))
+    up, down = bits << 6, bits >> 6
+    won |= up & (bits << 12) & ((bits << 18) | down)
+    won |= down & (bits >> 12) & (up | (bits >> 18))
+    up, down = bits << 8, bits >> 8
+    won |= up & (bits << 16) & ((bits << 24) | down)
+    won |= down & (bits >> 16) & (up | (bits >> 24))
+    return won & _CELLS
+
+
+# Columns weighted 1, 2, 3, 4, 3, 2, 1 from the edges to the center
+_CENTER_WEIGHTED = (0, 1, 1, 2, 2, 2, 3, 3, 3, 3, 4, 4, 4, 5, 5, 6)
+
+
+def _tactical_column(own, other, own_threats, other_threats, heights):
+    """
+    Column that wins for `own` at once, else one that blocks `other`, given
+    the `_threat_cells` of both, else a random column that is not full,
+    weighted towards the center
+    """
+    playable = ((own | other) + BitboardConnectFour.BOTTOM) & _CELLS
+    cells = own_threats & playable or other_threats & playable
+    if cells:
+        cell = cells & -cells  # lowest one
+        return (cell.bit_length() - 1) // BitboardConnectFour.COL_BITS
+    while True:
+        col = random.choice(_CENTER_WEIGHTED)
+        if heights[col] < BitboardConnectFour.NR_ROWS:
+            return col
+
+
+class TacticalPolicy:
+    """
+    Rollout policy for `MCTS(rollout_policy=...)`: win at once if possible,
+    else block the opponent's immediate win, else play a random column,
+    with the center columns more likely. Called with a node of either
+    Connect Four class it returns the next node; `move` picks the column
+    on a `BitboardScratch`, which lets simulations run in place.
+    """
+
+    def __call__(self, node):
+        bitboard = node
+        if not isinstance(node, BitboardConnectFour):
+            bitboard = BitboardConnectFour.from_board(node.board, node.turn)
+        own, other = bitboard.x_bits, bitboard.o_bits
+        if not bitboard.turn:
+            own, other = other, own
+        if bitboard.is_terminal():
+            return None
+        col = _tactical_column(
+            own, other, _threat_cells(own), _threat_cells(other), bitboard.heights
+        )
+        return node.play(col)
+
+    def move(self, board):
+        turn = board.turn
+        if board.nr_moves < 5:
+            own_threats = other_threats = 0  # nobody has three stones yet
+        else:
+            own_threats, other_threats = board.threats(turn), board.threats(not turn)
+        own, other = board.bits[turn], board.bits[not turn]
+        return _tactical_column(own, other, own_threats, other_threats, board.heights)
+
+
+tactical_policy = TacticalPolicy()
+
+
+def play_match(x_player, o_player, rollouts=None, time_limit=None):
+    """
+    Play one game between two searchers (`MCTS` or a subclass), each
+    searching for `rollouts` rollouts, `time_limit` seconds or both per
+    move, and return the reward for X. Both trees keep the subtree of the
+    position reached.
+    """
+    game = BitboardConnectFour()
+    while not game.is_terminal():
+        tree = x_player if game.turn else o_player
+        tree.search(game, rollouts=rollouts, time_limit=time_limit)
+        game = tree.choose(game)
+        x_player.advance(game)
+        o_player.advance(game)
+    return game.reward()
+
+
+def _match_score(make_player, make_opponent, games, **budget):
+    """
+    Total score of `make_player()` against `make_opponent()` over `games`
+    games with alternating colours, and its 95% margin. `budget` is passed
+    on to `play_match`.
+    """
+    score = 0
+    for i in range(games):
+        random.seed(i)
+        player, opponent = make_player(), make_opponent()
+        if i % 2 == 0:
+            score += play_match(player, opponent, **budget)
+        else:
+            score += 1 - play_match(opponent, player, **budget)
+    # Standard error of the mean score, counting draws as half a win
+    return score, 1.96 * math.sqrt(0.25 / games)
+
+
+def rollout_policy_benchmark(games=300, time_limit=0.1):
+    """
+    Print rollouts/sec of uniform random and tactical rollouts, and the
+    score of the tactical policy against random rollouts at equal time.
+    """
+    game = BitboardConnectFour()
+    for name, policy in (("random", None), ("tactical", tactical_policy)):
+        random.seed(0)
+        tree = MCTS(rollout_policy=policy)
+        done = tree.search(game, time_limit=2)
+        print(f"{name:>8} rollouts: {done / 2:8.0f} rollouts/sec")
+    score, margin = _match_score(
+        lambda: MCTS(rollout_policy=tactical_policy), MCTS, games, time_limit=time_limit
+    )
+    print(
+        f"tactical vs random, {time_limit}s/move: {score}/{games}"
+        f" ({score / games:.0%} +- {margin:.0%})"
+    )
+
+
+def play_game(book_path=None):
+    "Play against the search, from the opening book at `book_path` if given"
     tree = MCTS()
+    if book_path is not None:
+        from opening_book import OpeningBook
+
+        tree.book = OpeningBook.load(book_path)
     game = ConnectFourGame()
     print(game.to_pretty_string())
     while True:
@@ -112,15 +512,18 @@ def play_game():
         col = int(col)
         if not game.is_valid_move(col):
             raise RuntimeError("Invalid move")
-        game = ConnectFourGame(game.make_move(game.board, col - 1), turn=False)
+        game = game.play(col - 1)
+        tree.advance(game)
         print(game.to_pretty_string())
         if game.is_terminal():
             break
         # You can train as you go, or only at the beginning.
-        # Here, we train as we go, doing fifty rollouts each turn.
-        for _ in range(10000):
-            tree.do_rollout(game)
+        # Here, we train as we go, for at most 10000 rollouts or 2 seconds,
+        # except in book positions.
+        if tree.book is None or tree.book.lookup(game) is None:
+            tree.search(game, rollouts=10000, time_limit=2)
         game = tree.choose(game)
+        tree.advance(game)
         print(game)
         if game.is_terminal():
             break
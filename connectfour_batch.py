@@ -0,0 +1,89 @@
+"""
+Lockstep random playouts of many Connect Four positions at once.
+
+`simulate_batch` loads K positions into NumPy arrays (two uint64 bitboards,
+a height per column and the player to move for each game) and plays all K
+games to the end together: every step picks a random legal column for each
+unfinished game, drops the stones and checks for four in a row with the same
+shift-and-mask test as `BitboardConnectFour`, all as array operations.
+
+Pass it to `MCTS(batch_simulator=simulate_batch)` and call
+`MCTS.do_batch_rollout` to feed it several leaves per iteration.
+"""
+import random
+
+import numpy as np
+
+from connectfour import BitboardConnectFour
+
+NR_COLS = BitboardConnectFour.NR_COLS
+NR_ROWS = BitboardConnectFour.NR_ROWS
+COL_BITS = BitboardConnectFour.COL_BITS
+_SHIFTS = [np.uint64(shift) for shift in (1, 7, 6, 8)]
+
+
+def _has_four(bits):
+    "Element-wise `connectfour._has_four` on an array of bitboards"
+    won = np.zeros(bits.shape, dtype=bool)
+    for shift in _SHIFTS:
+        pairs = bits & (bits >> shift)
+        won |= (pairs & (pairs >> (shift + shift))) != 0
+    return won
+
+
+def _to_bitboard(game):
+    if isinstance(game, BitboardConnectFour):
+        return game
+    return BitboardConnectFour.from_board(game.board, game.turn)
+
+
+def simulate_batch(games, rng=None, lengths=None):
+    """
+    Play a uniformly random game to the end from each of `games` and return
+    the rewards as a float array, with the same meaning as the value returned
+    by `MCTS._simulate` for that node. The number of moves played in each
+    game is appended to the list `lengths`, if given. Without `rng`, the
+    moves are drawn from a generator seeded by `random`, so `random.seed`
+    makes batch searches reproducible like the others.
+    """
+    if rng is None:
+        rng = np.random.default_rng(random.getrandbits(64))
+    boards = [_to_bitboard(game) for game in games]
+    count = len(boards)
+    x = np.fromiter((b.x_bits for b in boards), dtype=np.uint64, count=count)
+    o = np.fromiter((b.o_bits for b in boards), dtype=np.uint64, count=count)
+    heights = np.array([b.heights for b in boards], dtype=np.int64).reshape(count, NR_COLS)
+    turn = np.fromiter((bool(b.turn) for b in boards), dtype=bool, count=count)
+    leaf_turn = turn.copy()
+    result = np.full(count, 0.5)  # 1 if X wins, 0 if O wins, .5 for a draw
+    for i, board in enumerate(boards):
+        if board.winner is not None:
+            result[i] = 1 if board.winner else 0
+    done = np.fromiter((b.is_terminal() for b in boards), dtype=bool, count=count)
+    plies = np.zeros(count, dtype=np.int64)
+
+    live = np.flatnonzero(~done)
+    while len(live):
+        h = heights[live]
+        # A random legal column: the largest random key among columns with room
+        keys = rng.random((len(live), NR_COLS))
+        keys[h >= NR_ROWS] = -1.0
+        col = keys.argmax(axis=1)
+        row = h[np.arange(len(live)), col]
+        move = np.left_shift(np.uint64(1), (col * COL_BITS + row).astype(np.uint64))
+        x_moves = turn[live]
+        x[live] |= np.where(x_moves, move, np.uint64(0))
+        o[live] |= np.where(x_moves, np.uint64(0), move)
+        heights[live, col] += 1
+        turn[live] = ~x_moves
+        plies[live] += 1
+
+        won = _has_four(np.where(x_moves, x[live], o[live]))
+        result[live[won]] = np.where(x_moves[won], 1.0, 0.0)
+        full = heights[live].sum(axis=1) == NR_COLS * NR_ROWS
+        live = live[~(won | full)]
+
+    if lengths is not None:
+        lengths.extend(plies.tolist())
+    # _simulate scores the game for the player who moved into the leaf
+    return np.where(leaf_turn, 1 - result, result)
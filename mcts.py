@@ -1,9 +1,15 @@
 #!/usr/bin/env python
 import random
 import math
-import hashlib
 import logging
 import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+try:
+	import numpy as np
+except ImportError:
+	np=None
 
 
 """
@@ -18,6 +24,9 @@ In particular there are two models of best child that one can use
 #MCTS scalar.  Larger scalar will increase exploitation, smaller will increase exploration. 
 SCALAR=1/math.sqrt(2.0)
 
+#BESTCHILD scores the children with NumPy from this many children on; for fewer the per call overhead of NumPy dominates
+VECTOR_MIN_CHILDREN=48
+
 logging.basicConfig(level=logging.WARNING)
 logger = logging.getLogger('MyLogger')
 
@@ -28,14 +37,41 @@ class State():
 	MOVES=[2,-2,3,-3]
 	MAX_VALUE= (5.0*(NUM_TURNS-1)*NUM_TURNS)/2
 	num_moves=len(MOVES)
-	def __init__(self, value=0, moves=[], turn=NUM_TURNS):
+	def __init__(self, value=0, moves=(), turn=NUM_TURNS):
 		self.value=value
 		self.turn=turn
-		self.moves=moves
+		#the move history is a linked list of (move, earlier history) pairs, so a child shares its parent's history instead of copying it
+		self.history=None
+		#the key is a hash of the move sequence, extended by one step per move
+		self.key=0
+		for move in moves:
+			self.history=(move,self.history)
+			self.key=hash((self.key,move))
+	def play(self,move):
+		#children keep the class, so subclasses keep their MOVES, NUM_TURNS and MAX_VALUE
+		cls=type(self)
+		next=cls.__new__(cls)
+		next.value=self.value+move
+		next.turn=self.turn-1
+		next.history=(move,self.history)
+		next.key=hash((self.key,move))
+		return next
 	def next_state(self):
 		nextmove=random.choice([x*self.turn for x  in self.MOVES])
-		next=State(self.value+nextmove, self.moves+[nextmove],self.turn-1)
-		return next
+		return self.play(nextmove)
+	@property
+	def moves(self):
+		moves=[]
+		history=self.history
+		while history is not None:
+			moves.append(history[0])
+			history=history[1]
+		moves.reverse()
+		return moves
+	def legal_moves(self):
+		if self.terminal():
+			return []
+		return [x*self.turn for x in self.MOVES]
 	def terminal(self):
 		if self.turn == 0:
 			return True
@@ -44,11 +80,19 @@ class State():
 		r = 1.0-(abs(self.value-self.GOAL)/self.MAX_VALUE)
 		return r
 	def __hash__(self):
-		return int(hashlib.md5(str(self.moves).encode('utf-8')).hexdigest(),16)
+		return self.key
 	def __eq__(self,other):
-		if hash(self)==hash(other):
-			return True
-		return False
+		if self.key!=other.key or self.turn!=other.turn or self.value!=other.value:
+			return False
+		#walk both histories until they reach a shared tail
+		mine=self.history
+		theirs=other.history
+		while mine is not theirs:
+			if mine is None or theirs is None or mine[0]!=theirs[0]:
+				return False
+			mine=mine[1]
+			theirs=theirs[1]
+		return True
 	def __repr__(self):
 		s="Value: %d; Moves: %s"%(self.value,self.moves)
 		return s
@@ -61,6 +105,8 @@ class Node():
 		self.state=state
 		self.children=[]
 		self.parent=parent	
+		#moves that have no child yet, in no particular order
+		self.untried=state.legal_moves()
 	def add_child(self,child_state):
 		child=Node(child_state,self)
 		self.children.append(child)
@@ -68,7 +114,7 @@ class Node():
 		self.reward+=reward
 		self.visits+=1
 	def fully_expanded(self):
-		if len(self.children)==self.state.num_moves:
+		if len(self.untried)==0:
 			return True
 		return False
 	def __repr__(self):
@@ -77,40 +123,122 @@ class Node():
 		
 
 
-def UCTSEARCH(budget,root):
-	for iter in range(int(budget)):
-		if iter%10000==9999:
+def UCTSEARCH(budget,root,rollouts_per_leaf=1,time_limit=None,stats=None):
+	#budget is the number of iterations (None for no limit), time_limit optionally stops the search after that many seconds
+	#stats, a search_stats.SearchStats, is filled in with counters and per phase times; without it the plain phases run
+	treepolicy,defaultpolicy,defaultpolicy_vector,backup=TREEPOLICY,DEFAULTPOLICY,DEFAULTPOLICY_VECTOR,BACKUP
+	if stats is not None:
+		treepolicy,defaultpolicy,defaultpolicy_vector,backup=INSTRUMENT(stats)
+	if budget is not None:
+		budget=int(budget)
+	deadline=None if time_limit is None else time.monotonic()+time_limit
+	#one generator for the whole search, seeded from random so random.seed makes the search reproducible
+	rng=None
+	if rollouts_per_leaf!=1 and np is not None:
+		rng=np.random.default_rng(random.getrandbits(64))
+	iter=0
+	while budget is None or iter<budget:
+		if deadline is not None and time.monotonic()>=deadline:
+			break
+		iter+=1
+		if iter%10000==0:
 			logger.info("simulation: %d"%iter)
 			logger.info(root)
-		front=TREEPOLICY(root)
-		reward=DEFAULTPOLICY(front.state)
-		BACKUP(front,reward)
+		front=treepolicy(root)
+		if rollouts_per_leaf==1:
+			reward=defaultpolicy(front.state)
+		else:
+			rewards=defaultpolicy_vector(front.state,rollouts_per_leaf,rng)
+			reward=sum(rewards)/len(rewards)
+		backup(front,reward)
 	return BESTCHILD(root,0)
 
-def TREEPOLICY(node):
+#the phases of UCTSEARCH wrapped to time them and count into stats.  Expansion happens inside the tree policy, so its time is taken out of the selection time
+def INSTRUMENT(stats):
+	expand=stats.timed("expand",EXPAND)
+	def treepolicy(root):
+		start=time.perf_counter()
+		expanded=stats.seconds["expand"]
+		front=TREEPOLICY(root,expand)
+		stats.seconds["select"]+=time.perf_counter()-start-(stats.seconds["expand"]-expanded)
+		counts=[]
+		node=front
+		while node is not root:
+			node=node.parent
+			counts.append(len(node.children))
+		stats.record_selection(len(counts),counts)
+		if front.state.terminal():
+			stats.terminal_hits+=1
+		return front
+	#a random game from state plays exactly state.turn more moves
+	def defaultpolicy(state):
+		stats.record_simulation(state.turn)
+		return DEFAULTPOLICY(state)
+	def defaultpolicy_vector(state,rollouts,rng=None):
+		stats.record_simulation(state.turn,rollouts)
+		return DEFAULTPOLICY_VECTOR(state,rollouts,rng)
+	return (treepolicy,stats.timed("simulate",defaultpolicy),
+		stats.timed("simulate",defaultpolicy_vector),stats.timed("backpropagate",BACKUP))
+
+def UCTSEARCH_WORKER(job):
+	budget,state,seed,rollouts_per_leaf,time_limit=job
+	random.seed(seed)
+	root=Node(state)
+	UCTSEARCH(budget,root,rollouts_per_leaf,time_limit)
+	return [(c.state,c.visits,c.reward) for c in root.children]
+
+#root parallelization: every worker process grows its own tree from root.state with its own seed and the visits and rewards of the root children are summed into root
+def UCTSEARCH_PARALLEL(budget,root,workers=None,rollouts_per_leaf=1,time_limit=None,seed=None):
+	workers=workers or os.cpu_count()
+	if seed is None:
+		seed=random.getrandbits(32)
+	share=None if budget is None else budget/workers
+	jobs=[(share,root.state,seed+i,rollouts_per_leaf,time_limit) for i in range(workers)]
+	with ProcessPoolExecutor(workers) as pool:
+		results=list(pool.map(UCTSEARCH_WORKER,jobs))
+	children={c.state:c for c in root.children}
+	for result in results:
+		for state,visits,reward in result:
+			if state not in children:
+				root.untried.remove(state.history[0])
+				root.add_child(state)
+				children[state]=root.children[-1]
+				children[state].visits=0
+			children[state].visits+=visits
+			children[state].reward+=reward
+			root.visits+=visits
+			root.reward+=reward
+	return BESTCHILD(root,0)
+
+def TREEPOLICY(node,expand=None):
+	#expand stands in for EXPAND, e.g. to time it
+	expand=expand or EXPAND
 	#a hack to force 'exploitation' in a game where there are many options, and you may never/not want to fully expand first
 	while node.state.terminal()==False:
 		if len(node.children)==0:
-			return EXPAND(node)
+			return expand(node)
 		elif random.uniform(0,1)<.5:
 			node=BESTCHILD(node,SCALAR)
 		else:
 			if node.fully_expanded()==False:	
-				return EXPAND(node)
+				return expand(node)
 			else:
 				node=BESTCHILD(node,SCALAR)
 	return node
 
 def EXPAND(node):
-	tried_children=[c.state for c in node.children]
-	new_state=node.state.next_state()
-	while new_state in tried_children:
-		new_state=node.state.next_state()
-	node.add_child(new_state)
+	#pick a random untried move and swap the last one into its slot
+	i=random.randrange(len(node.untried))
+	move=node.untried[i]
+	node.untried[i]=node.untried[-1]
+	node.untried.pop()
+	node.add_child(node.state.play(move))
 	return node.children[-1]
 
 #current this uses the most vanilla MCTS formula it is worth experimenting with THRESHOLD ASCENT (TAGS)
 def BESTCHILD(node,scalar):
+	if np is not None and len(node.children)>=VECTOR_MIN_CHILDREN:
+		return BESTCHILD_VECTOR(node,scalar)
 	bestscore=0.0
 	bestchildren=[]
 	for c in node.children:
@@ -126,11 +254,37 @@ def BESTCHILD(node,scalar):
 		logger.warn("OOPS: no best child found, probably fatal")
 	return random.choice(bestchildren)
 
+def BESTCHILD_VECTOR(node,scalar):
+	count=len(node.children)
+	rewards=np.fromiter((c.reward for c in node.children),dtype=np.float64,count=count)
+	visits=np.fromiter((c.visits for c in node.children),dtype=np.float64,count=count)
+	scores=rewards/visits+scalar*np.sqrt(2.0*math.log(node.visits)/visits)
+	bestchildren=np.flatnonzero(scores==scores.max())
+	return node.children[int(random.choice(bestchildren))]
+
 def DEFAULTPOLICY(state):
 	while state.terminal()==False:
 		state=state.next_state()
 	return state.reward()
 
+#the end value of a random game is the current value plus, for every remaining turn t, a random pick from MOVES times t.
+#so the picks for all remaining turns of all rollouts are drawn as one array and weighted by the turn numbers.
+#rng is a numpy Generator; without one a new one is seeded from random, so random.seed makes the rollouts reproducible
+def DEFAULTPOLICY_VECTOR(state,rollouts,rng=None):
+	if state.terminal():
+		return [state.reward()]*rollouts
+	if np is not None:
+		if rng is None:
+			rng=np.random.default_rng(random.getrandbits(64))
+		picks=np.asarray(state.MOVES)[rng.integers(len(state.MOVES),size=(rollouts,state.turn))]
+		values=state.value+picks@np.arange(state.turn,0,-1)
+		return 1.0-np.abs(values-state.GOAL)/state.MAX_VALUE
+	rewards=[]
+	for r in range(rollouts):
+		value=state.value+sum(random.choice(state.MOVES)*t for t in range(state.turn,0,-1))
+		rewards.append(1.0-(abs(value-state.GOAL)/state.MAX_VALUE))
+	return rewards
+
 def BACKUP(node,reward):
 	while node!=None:
 		node.visits+=1
@@ -142,16 +296,29 @@ if __name__=="__main__":
 	parser = argparse.ArgumentParser(description='MCTS research code')
 	parser.add_argument('--num_sims', action="store", required=True, type=int)
 	parser.add_argument('--levels', action="store", required=True, type=int, choices=range(State.NUM_TURNS))
+	parser.add_argument('--rollouts_per_leaf', action="store", default=1, type=int)
+	parser.add_argument('--workers', action="store", default=1, type=int)
+	parser.add_argument('--stats', action="store_true", help="print counters and per phase times of each search")
 	args=parser.parse_args()
+	stats=None
+	if args.stats:
+		from search_stats import SearchStats
+		stats=SearchStats()
 	
 	current_node=Node(State())
 	for l in range(args.levels):
-		current_node=UCTSEARCH(args.num_sims/(l+1),current_node)
+		if args.workers>1:
+			current_node=UCTSEARCH_PARALLEL(args.num_sims/(l+1),current_node,args.workers,args.rollouts_per_leaf)
+		else:
+			current_node=UCTSEARCH(args.num_sims/(l+1),current_node,args.rollouts_per_leaf,stats=stats)
 		print("level %d"%l)
 		print("Num Children: %d"%len(current_node.children))
 		for i,c in enumerate(current_node.children):
 			print(i,c)
 		print("Best Child: %s"%current_node.state)
+		if stats is not None and args.workers<=1:
+			print(stats)
+			stats.reset()
 		
 		print("--------------------------------")	
 			
\ No newline at end of file
@@ -5,41 +5,142 @@ See also https://en.wikipedia.org/wiki/Monte_Carlo_tree_search
 https://gist.github.com/qpwo/c538c6f73727e254fdc7fab81024f6e1
 """
 from abc import ABC, abstractmethod
-from collections import defaultdict
+from collections import defaultdict, namedtuple
+import inspect
 import math
+import random
+import time
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional, UCT selection then stays scalar
+    np = None
+
+
+SearchSnapshot = namedtuple(
+    "SearchSnapshot", "rollouts elapsed rollouts_per_sec best_move visits"
+)
+
+
+def uct_best_index(Q, N, log_N_vertex, exploration_weight):
+    """
+    Index of the candidate with the highest UCT score, ties broken at
+    random, from NumPy float arrays of the candidates' total rewards `Q`
+    and visit counts `N` and the log of their parent's visit count
+    """
+    uct = Q / N + exploration_weight * np.sqrt(log_N_vertex / N)
+    best = np.flatnonzero(uct == uct.max())
+    return int(best[0] if len(best) == 1 else random.choice(best))
 
 
 class MCTS:
     "Monte Carlo tree searcher. First rollout the tree then choose a move."
 
-    def __init__(self, exploration_weight=1):
+    # Number of candidates from which UCT scores are computed with NumPy.
+    # Below it the fixed cost of building the arrays outweighs the loop.
+    VECTORIZE_MIN_CHILDREN = 96
+    # Once over budget, evict down to this fraction of it
+    EVICT_TO = 0.75
+
+    def __init__(
+        self,
+        exploration_weight=1,
+        batch_simulator=None,
+        batch_size=16,
+        max_nodes=None,
+        book=None,
+        solver=False,
+        rollout_policy=None,
+        lazy_expansion=False,
+        widening=None,
+        stats=None,
+    ):
         self.Q = defaultdict(
             int
-        )  # Number of wins of False, especially self.N if false wins, 0 if true wins
+        )  # Total reward of the player who moved into each node, see score
         self.N = defaultdict(int)  # total visit count for each node
         self.children = dict()  # node -> children of the node
         self.exploration_weight = exploration_weight
         self.terminal = (
             {}
-        )  # If terminal node = Q/N, else min/max depending on active player
+        )  # Proven value of a node (e.g. a terminal one), in the scale of score
+        # Optional function simulating a list of leaves at once, see do_batch_rollout
+        self.batch_simulator = batch_simulator
+        self.batch_size = batch_size
+        # Optional budget on resident_nodes, see _evict. Memory then stays
+        # proportional to it: tracemalloc peaks at about 370 bytes per
+        # resident node on BitboardConnectFour and 880 on ConnectFourGame.
+        self.max_nodes = max_nodes
+        self._child_entries = 0  # total size of the sets in `children`
+        self.evictions = 0  # number of subtrees collapsed to stay in budget
+        self.evicted_nodes = 0  # number of nodes dropped by those collapses
+        # Optional opening book, whose `lookup(node)` gives the move to play
+        # or None, see opening_book.py
+        self.book = book
+        # Prove wins and losses and stop searching proven nodes, see _solve
+        self.solver = solver
+        # Function from a node to the next node of a simulation, uniformly
+        # random (`find_random_child`) if None. If it also has a
+        # `move(board)` method, nodes with a `scratch` board are simulated
+        # on it in place, with `move` picking each move.
+        self.rollout_policy = rollout_policy
+        # Create children one at a time from `node.iter_children()` when
+        # selection reaches their parent, see _widen. With `widening` set, a
+        # node visited N times has at most ceil(N ** widening) children.
+        self.lazy_expansion = lazy_expansion or widening is not None
+        self.widening = widening
+        self._pending = {}  # node -> iterator over its children not yet created
+        # Optional `search_stats.SearchStats` that counts and times the
+        # phases of every rollout, see _instrument
+        self.stats = stats
+        if stats is not None:
+            self._instrument(stats)
+
+    @property
+    def resident_nodes(self):
+        """
+        Number of node references the tree holds: one per node with
+        statistics, per child of an expanded node and per cached value. A
+        node can count more than once, so memory stays below `max_nodes`
+        times the size of one node and its table slots.
+        """
+        return len(self.N) + len(self.terminal) + self._child_entries
 
     def score(self, n):
+        """
+        Value of `n` for False: 1 if False wins, 0 if True wins. Proven values
+        in `terminal` are kept in this scale, while Q/N is the mean reward
+        of the player who moved into `n`.
+        """
         try:
             return self.terminal[n]
         except KeyError:
             if self.N[n] == 0:
                 # avoid unseen moves
-                return float("inf") if n.turn else float("-inf")
-            return self.Q[n] / self.N[n]
+                return float("-inf") if n.turn else float("inf")
+            value = self.Q[n] / self.N[n]
+            return value if n.turn else 1 - value
 
     def choose(self, node):
         "Choose the best successor of node. (Choose a move in the game)"
         if node.is_terminal():
             raise RuntimeError(f"choose called on terminal node {node}")
 
-        if node not in self.children:
+        if self.book is not None:
+            move = self.book.lookup(node)
+            if move is not None:
+                return move
+
+        if not self.children.get(node):
+            # Not expanded yet, or lazily expanded without any child so far
             return node.find_random_child()
 
+        if self.solver and node in self.terminal:
+            # Play a child that achieves the proven value
+            for child in self.children[node]:
+                if self.terminal.get(child) == self.terminal[node]:
+                    return child
+
         if node.turn:
             return min(self.children[node], key=self.score)
         else:
@@ -53,27 +154,233 @@ class MCTS:
             self._expand(leaf)
             reward = self._simulate(leaf)
         else:
-            rewards = [self.score(child) for child in self.children[leaf]]
-            if leaf.turn:
-                reward = min(rewards)
-            else:
-                reward = max(rewards)
-            assert reward in (0, 0.5, 1)
-            best_choice = self.choose(leaf)
-            assert self.score(best_choice) == reward
-            self.terminal[leaf] = reward
-            # assert self.Q[best_choice] / self.N[best_choice] == reward
+            reward = self._resolve_dead_end(leaf)
         self._backpropagate(path, reward)
+        if self.solver:
+            self._solve(path)
+        if self.max_nodes is not None and self.resident_nodes > self.max_nodes:
+            self._evict(node)
+
+    def search(self, node, rollouts=None, time_limit=None):
+        """
+        Do rollouts from `node` until `rollouts` are done or `time_limit`
+        seconds have passed, whichever comes first. Returns the number of
+        rollouts done.
+        """
+        done = 0
+        for snapshot in self.search_iter(node, rollouts, time_limit, every=None):
+            done = snapshot.rollouts
+        return done
+
+    def search_iter(self, node, rollouts=None, time_limit=None, every=1000):
+        """
+        Same as `search`, as a generator: yields a `SearchSnapshot` of the
+        root statistics every `every` rollouts and once more at the end,
+        unless the last one was already taken after the final rollout.
+        """
+        if rollouts is None and time_limit is None:
+            raise ValueError("search needs a rollout budget, a time limit or both")
+        start = time.monotonic()
+        deadline = None if time_limit is None else start + time_limit
+        step = 1 if self.batch_simulator is None else self.batch_size
+        done = 0
+        next_snapshot = every
+        snapshot_done = None
+        while rollouts is None or done < rollouts:
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            if self.solver and node in self.terminal:
+                break  # the root is proven, more rollouts cannot change it
+            count = step if rollouts is None else min(step, rollouts - done)
+            if self.batch_simulator is None:
+                self.do_rollout(node)
+            else:
+                self.do_batch_rollout(node, count)
+            done += count
+            if every is not None and done >= next_snapshot:
+                next_snapshot += every
+                snapshot_done = done
+                yield self._snapshot(node, done, time.monotonic() - start)
+        if snapshot_done != done:
+            yield self._snapshot(node, done, time.monotonic() - start)
+
+    def _snapshot(self, node, done, elapsed):
+        children = self.children.get(node, ())
+        best_move = None if node.is_terminal() or not children else self.choose(node)
+        return SearchSnapshot(
+            rollouts=done,
+            elapsed=elapsed,
+            rollouts_per_sec=done / elapsed if elapsed > 0 else 0.0,
+            best_move=best_move,
+            visits={child: self.N[child] for child in children},
+        )
+
+    def advance(self, new_root):
+        """
+        Keep only the part of the tree reachable from `new_root`, the
+        position actually reached in the game, and drop everything else.
+        Costs O(size of the kept part), so it can be called every move.
+        """
+        reachable = {new_root}
+        frontier = [new_root]
+        while frontier:
+            for child in self.children.get(frontier.pop(), ()):
+                if child not in reachable:
+                    reachable.add(child)
+                    frontier.append(child)
+        self._keep_only(reachable)
+
+    def _keep_only(self, nodes):
+        "Drop all statistics of nodes not in `nodes`"
+        self.Q = defaultdict(int, {n: self.Q[n] for n in nodes if n in self.Q})
+        self.N = defaultdict(int, {n: self.N[n] for n in nodes if n in self.N})
+        self.children = {n: self.children[n] for n in nodes if n in self.children}
+        self._child_entries = sum(map(len, self.children.values()))
+        self.terminal = {n: self.terminal[n] for n in nodes if n in self.terminal}
+        self._pending = {n: self._pending[n] for n in nodes if n in self._pending}
+
+    def do_batch_rollout(self, node, count=None):
+        """
+        Do `count` rollouts (`batch_size` by default), simulating their
+        leaves together with `batch_simulator`. Each selected path is counted
+        as visited straight away, before its reward is known, so later
+        selections in the same batch spread out to other leaves.
+        """
+        pending = []
+        for _ in range(self.batch_size if count is None else count):
+            path, dead_end = self._select(node)
+            leaf = path[-1]
+            if dead_end:
+                self._backpropagate(path, self._resolve_dead_end(leaf))
+                if self.solver:
+                    self._solve(path)
+                continue
+            self._expand(leaf)
+            if leaf.is_terminal():
+                self._backpropagate(path, self._simulate(leaf))
+                if self.solver:
+                    self._solve(path)
+                continue
+            for n in path:
+                self.N[n] += 1
+            pending.append(path)
+        if not pending:
+            return
+        rewards = self.batch_simulator([path[-1] for path in pending])
+        for path, reward in zip(pending, rewards):
+            self._backpropagate_visited(path, float(reward))
+            if self.solver:
+                self._solve(path)
+        if self.max_nodes is not None and self.resident_nodes > self.max_nodes:
+            self._evict(node)
+
+    def _evict(self, root):
+        """
+        Shrink the tree to EVICT_TO of `max_nodes`. Expanded nodes whose
+        children are all leaves (none of their own children has statistics)
+        are collapsed back into leaves, least visited first: their children
+        and the children's statistics are dropped, but the collapsed node
+        keeps its own Q and N, which already include every visit of the
+        dropped children. `root` is never collapsed.
+        """
+        target = int(self.max_nodes * self.EVICT_TO)
+        # Values cached for rollout end points outside the tree go first
+        self.terminal = {n: v for n, v in self.terminal.items() if n in self.N}
+        self._child_entries = sum(map(len, self.children.values()))
+        N, children = self.N, self.children
+
+        while self.resident_nodes > target:
+            # Expanded nodes with statistics below them; the fringe are those
+            # none of whose children is one, found in two linear passes
+            inner = {
+                node for node, nodes in children.items() if any(c in N for c in nodes)
+            }
+            fringe = [
+                node
+                for node in inner
+                if node != root and not any(c in inner for c in children[node])
+            ]
+            if not fringe:
+                break
+            fringe.sort(key=lambda node: N.get(node, 0))
+            for node in fringe:
+                self._collapse(node)
+                if self.resident_nodes <= target:
+                    break
+
+    def _collapse(self, node):
+        "Turn the expanded `node` back into a leaf"
+        self._pending.pop(node, None)
+        children = self.children.pop(node)
+        self._child_entries -= len(children)
+        for child in children:
+            if child in self.N:
+                self.evicted_nodes += 1
+            self.N.pop(child, None)
+            self.Q.pop(child, None)
+            self.terminal.pop(child, None)
+            # A child can be expanded without any visited child of its own
+            self._child_entries -= len(self.children.pop(child, ()))
+            self._pending.pop(child, None)
+        self.evictions += 1
+
+    def _resolve_dead_end(self, leaf):
+        "Value of a leaf whose children are all terminal or already decided"
+        rewards = [self.score(child) for child in self.children[leaf]]
+        if leaf.turn:
+            reward = min(rewards)
+        else:
+            reward = max(rewards)
+        assert reward in (0, 0.5, 1)
+        best_choice = self.choose(leaf)
+        assert self.score(best_choice) == reward
+        self.terminal[leaf] = reward
+        # Backpropagate it for the player who moved into the leaf
+        return reward if leaf.turn else 1 - reward
+
+    def _solve(self, path):
+        """
+        MCTS-Solver: prove the nodes of `path` from the leaf up, and stop at
+        the first node that cannot be proven yet. Proven values go into
+        `terminal`, in the scale of `score`: the player to move at a node
+        with `turn` True wants the lowest child value, the other player the
+        highest. A node is proven as soon as one child is proven to be the
+        best value its player can get (a win), or once all its children are
+        proven (then it gets their min or max, e.g. a loss or a draw).
+        """
+        for node in reversed(path):
+            if node in self.terminal:
+                continue
+            children = self.children.get(node)
+            if not children:
+                return
+            values = [self.terminal.get(child) for child in children]
+            win = 0 if node.turn else 1
+            if win in values:
+                self.terminal[node] = win
+            elif None in values or node in self._pending:
+                return
+            else:
+                self.terminal[node] = min(values) if node.turn else max(values)
 
     def _select(self, node):
         "Find an unexplored descendent of `node`"
         path = []
         while True:
             path.append(node)
+            if self._pending and node in self._pending:
+                child = self._widen(node)
+                if child is not None:
+                    path.append(child)
+                    return path, False
             if node not in self.children or not self.children[node]:
                 # node is either unexplored or terminal
                 return path, False
-            unexplored = [node for node in self.children[node] if self.N[node] == 0]
+            unexplored = [
+                n
+                for n in self.children[node]
+                if self.N[n] == 0 and not (self.solver and n in self.terminal)
+            ]
             if unexplored:
                 n = unexplored.pop()
                 path.append(n)
@@ -85,35 +392,157 @@ class MCTS:
                 if (n not in self.terminal) and (not n.is_terminal()) and self.N[n] > 0
             ]
             if len(interesting) == 0:
+                if node in self._pending:
+                    # Everything created so far is decided, so widen anyway
+                    child = self._widen(node, force=True)
+                    if child is not None:
+                        path.append(child)
+                        return path, False
                 return path, True
-            node = self._uct_select(node)  # descend a layer deeper
+            node = self._uct_select(node, interesting)  # descend a layer deeper
 
     def _expand(self, node):
         "Update the `children` dict with the children of `node`"
         if node in self.children:
             return  # already expanded
 
-        self.children[node] = node.find_children()
+        if self.lazy_expansion:
+            self.children[node] = set()
+            if not node.is_terminal():
+                self._pending[node] = node.iter_children()
+            return
+
+        # Some games (e.g. TicTacToeChat) still list moves once the game is over
+        self.children[node] = set() if node.is_terminal() else node.find_children()
+        self._child_entries += len(self.children[node])
+
+        if self.solver:
+            # Terminal children are proven without simulating them
+            for child in self.children[node]:
+                if child.is_terminal() and child not in self.terminal:
+                    self.terminal[child] = 1 - child.reward()
+            return
 
         # Check if any of the cild nodes represent previously visited states:
         if len(self.children[node]) > 0:
             if all([child.is_terminal() for child in self.children[node]]):
-                if all([self.Q[child] > 0 for child in self.children[node]]):
+                values = [
+                    self.score(child) if self.N.get(child) else 0
+                    for child in self.children[node]
+                ]
+                if all([value > 0 for value in values]):
                     # Remove child node from the list of children?
-                    self.terminal[node] = max(
-                        [self.Q[child] / self.N[child] for child in self.children[node]]
-                    )
+                    self.terminal[node] = min(values) if node.turn else max(values)
+
+    def _widen(self, node, force=False):
+        """
+        Create the next child of the lazily expanded `node` and return it,
+        or None if it has no more children or, unless `force`, the widening
+        limit is reached
+        """
+        children = self.children[node]
+        if not force and self.widening is not None:
+            if len(children) >= math.ceil(max(self.N[node], 1) ** self.widening):
+                return None
+        try:
+            child = next(self._pending[node])
+        except StopIteration:
+            del self._pending[node]
+            return None
+        children.add(child)
+        self._child_entries += 1
+        return child
 
-    def _simulate(self, node):
-        "Returns the reward for a random simulation (to completion) of `node`"
-        invert_reward = True
+    def _simulate(self, node, moves=None):
+        """
+        Returns the reward for a random simulation (to completion) of `node`,
+        for the player who moved into `node`. The moves played are appended
+        to the list `moves`, if given.
+        """
+        # Rewards are 1 if True wins; the player who moved into `node` is
+        # False when True is to move
+        leaf_turn = node.turn
+        policy = self.rollout_policy
+        pick = None if policy is None else getattr(policy, "move", None)
+        board = None
+        if (policy is None or pick is not None) and not node.is_terminal():
+            board = node.scratch()
+        if board is not None:
+            # Play the moves in place, only the final state becomes a node
+            while not board.is_terminal():
+                if pick is None:
+                    move = random.choice(board.legal_moves())
+                else:
+                    move = pick(board)
+                board.apply_move(move)
+                if moves is not None:
+                    moves.append(move)
+            reward = board.reward()
+            self.terminal[board.to_node()] = 1 - reward
+            return 1 - reward if leaf_turn else reward
         while True:
             if node.is_terminal():
                 reward = node.reward()
                 self.terminal[node] = 1 - reward
-                return 1 - reward if invert_reward else reward
-            node = node.find_random_child()
-            invert_reward = not invert_reward
+                return 1 - reward if leaf_turn else reward
+            child = node.find_random_child() if policy is None else policy(node)
+            if moves is not None:
+                moves.append(node.move_to(child))
+            node = child
+
+    def _instrument(self, stats):
+        """
+        Replace the phase methods of this searcher by wrappers that time them
+        and fill in `stats`. The wrappers are instance attributes, so a
+        searcher without stats runs the plain methods. Simulations are only
+        counted for nodes with `move_to`, as their length comes from the
+        list of moves played, and for batch simulators that take a
+        `lengths` list to append the length of each simulation to.
+        """
+        select, simulate = self._select, self._simulate
+        takes_moves = "moves" in inspect.signature(simulate).parameters
+
+        def counted_select(node):
+            path, dead_end = select(node)
+            if dead_end or path[-1] in self.terminal:
+                stats.terminal_hits += 1
+            stats.record_selection(
+                len(path) - 1, [len(self.children[n]) for n in path[:-1]]
+            )
+            return path, dead_end
+
+        def counted_simulate(node, moves=None):
+            if moves is None:
+                if not takes_moves or type(node).move_to is Node.move_to:
+                    return simulate(node)
+                moves = []
+            before = len(moves)
+            reward = simulate(node, moves)
+            stats.record_simulation(len(moves) - before)
+            return reward
+
+        self._select = stats.timed("select", counted_select)
+        self._expand = stats.timed("expand", self._expand)
+        self._simulate = stats.timed("simulate", counted_simulate)
+        self._backpropagate = stats.timed("backpropagate", self._backpropagate)
+        self._backpropagate_visited = stats.timed(
+            "backpropagate", self._backpropagate_visited
+        )
+
+        batch = self.batch_simulator
+        if batch is not None:
+            takes_lengths = "lengths" in inspect.signature(batch).parameters
+
+            def counted_batch(leaves):
+                if not takes_lengths:
+                    return batch(leaves)
+                lengths = []
+                rewards = batch(leaves, lengths=lengths)
+                for length in lengths:
+                    stats.record_simulation(length)
+                return rewards
+
+            self.batch_simulator = stats.timed("simulate", counted_batch)
 
     def _backpropagate(self, path, reward):
         "Send the reward back up to the ancestors of the leaf"
@@ -122,18 +551,25 @@ class MCTS:
             self.Q[node] += reward
             reward = 1 - reward  # 1 for me is 0 for my enemy, and vice versa
 
-    def _uct_select(self, node):
+    def _backpropagate_visited(self, path, reward):
+        "Same as _backpropagate, for a path whose visits are already counted"
+        for node in reversed(path):
+            self.Q[node] += reward
+            reward = 1 - reward
+
+    def _uct_select(self, node, interesting=None):
         "Select a child of node, balancing exploration & exploitation"
 
-        # All children of node should already be expanded:
-        assert all(n in self.children for n in self.children[node])
+        if interesting is None:
+            # Only non-terminals, not visited:
+            interesting = [
+                n
+                for n in self.children[node]
+                if (n not in self.terminal) and (not n.is_terminal()) and self.N[n] > 0
+            ]
 
-        # Only non-terminals, not visited:
-        interesting = [
-            n
-            for n in self.children[node]
-            if (n not in self.terminal) and (not n.is_terminal()) and self.N[n] > 0
-        ]
+        if np is not None and len(interesting) >= self.VECTORIZE_MIN_CHILDREN:
+            return self._uct_select_vectorized(node, interesting)
 
         log_N_vertex = math.log(self.N[node])
 
@@ -145,6 +581,14 @@ class MCTS:
 
         return max(interesting, key=uct)
 
+    def _uct_select_vectorized(self, node, interesting):
+        "UCT over all candidates in one NumPy expression, ties broken at random"
+        count = len(interesting)
+        Q = np.fromiter((self.Q[n] for n in interesting), dtype=np.float64, count=count)
+        N = np.fromiter((self.N[n] for n in interesting), dtype=np.float64, count=count)
+        log_N_vertex = math.log(self.N[node])
+        return interesting[uct_best_index(Q, N, log_N_vertex, self.exploration_weight)]
+
     def __str__(self) -> str:
         rval = ""
         rval += f"total reward of each node: {str(self.Q)}\n"
@@ -190,3 +634,29 @@ class Node(ABC):
     def __eq__(node1, node2):
         "Nodes must be comparable"
         return True
+
+    def iter_children(self):
+        "Successors one at a time, for `MCTS(lazy_expansion=True)`"
+        return iter(self.find_children())
+
+    def move_to(self, child):
+        "The move (as in `scratch`) from this state to `child`, for SearchStats"
+        raise NotImplementedError(f"{type(self).__name__} does not support move_to")
+
+    def scratch(self):
+        """
+        Mutable copy of this state for simulations without a node per ply,
+        None if unsupported. It provides `legal_moves()`, `apply_move(move)`,
+        `undo_move(move)`, `is_terminal()`, `reward()` and `to_node()`. The
+        moves are listed in the order `find_random_child` picks from.
+        """
+        return None
+
+    def encode(self):
+        "Compact bytes encoding of the state for other processes, None if unsupported"
+        return None
+
+    @classmethod
+    def decode(cls, data):
+        "Rebuild a node from the bytes returned by `encode`"
+        raise NotImplementedError(f"{cls.__name__} does not support decode")
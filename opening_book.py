@@ -0,0 +1,137 @@
+"""
+Opening book for Connect Four.
+
+`build_book` runs a deep search from every position of the first `plies`
+plies and records the best column and its value. The searches run on
+`BitboardConnectFour`, optionally in a process pool. Positions are keyed by
+the bitboard key (`x_bits + mask + BOTTOM`), which is unique per position,
+so a `ConnectFourGame` and a `BitboardConnectFour` of the same position
+share their book entry.
+
+The book is saved as three flat arrays (sorted keys, columns and values)
+and loaded into a dict, so `lookup` is a single hash probe. Pass it to
+`MCTS(book=...)` and `choose` plays book moves without any search.
+
+Run this file to build `connectfour.book`.
+"""
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+import random
+import struct
+import sys
+
+from connectfour import BitboardConnectFour
+from monte_carlo_tree_search import MCTS
+
+MAGIC = b"C4BOOK01"
+HEADER = struct.Struct("<8sQ")
+
+
+def position_key(node):
+    "Book key of a Connect Four position, `ConnectFourGame` or bitboard"
+    if not isinstance(node, BitboardConnectFour):
+        node = BitboardConnectFour.from_board(node.board, node.turn)
+    return node.key
+
+
+def opening_positions(plies):
+    "All distinct non-terminal positions reached in fewer than `plies` plies"
+    layer = {BitboardConnectFour()}
+    positions = []
+    for _ in range(plies):
+        positions.extend(sorted(layer, key=position_key))
+        layer = {child for node in layer for child in node.find_children()}
+    return [node for node in positions if not node.is_terminal()]
+
+
+def _search_position(data, rollouts, seed):
+    "Worker: best column and its value for the encoded position"
+    random.seed(seed)
+    node = BitboardConnectFour.decode(data)
+    tree = MCTS()
+    tree.search(node, rollouts=rollouts)
+    best = tree.choose(node)
+    col = next(c for c in node.valid_moves() if node.play(c) == best)
+    return node.key, col, tree.score(best)
+
+
+def build_book(plies=4, rollouts=20000, workers=None, seed=0, positions=None):
+    """
+    Search every opening position of fewer than `plies` plies, or the
+    `BitboardConnectFour` nodes in `positions` if given, for `rollouts`
+    rollouts and return the resulting `OpeningBook`. With `workers`, the
+    positions are searched in that many processes. The result only depends
+    on `seed`, not on the number of workers.
+    """
+    if positions is None:
+        positions = opening_positions(plies)
+    tasks = [(node.encode(), rollouts, seed + i) for i, node in enumerate(positions)]
+    if workers is None:
+        results = [_search_position(*task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(workers) as pool:
+            results = list(pool.map(_search_position, *zip(*tasks)))
+    return OpeningBook({key: (col, value) for key, col, value in results})
+
+
+class OpeningBook:
+    "Best column and value per position, keyed by `position_key`"
+
+    def __init__(self, entries=None):
+        self.entries = entries or {}  # key -> (column, value)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, node):
+        return position_key(node) in self.entries
+
+    def lookup(self, node):
+        "The book move from `node` as a child position, None if not in the book"
+        entry = self.entries.get(position_key(node))
+        if entry is None:
+            return None
+        return node.play(entry[0])
+
+    def value(self, node):
+        "Value of the book move from `node`, in the scale of `MCTS.score`"
+        entry = self.entries.get(position_key(node))
+        return None if entry is None else entry[1]
+
+    def save(self, path):
+        keys = array("Q", sorted(self.entries))
+        cols = array("b", (self.entries[key][0] for key in keys))
+        values = array("f", (self.entries[key][1] for key in keys))
+        if sys.byteorder == "big":
+            keys.byteswap()
+            values.byteswap()
+        with open(path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, len(keys)))
+            f.write(keys.tobytes())
+            f.write(cols.tobytes())
+            f.write(values.tobytes())
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            magic, count = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not a Connect Four opening book")
+            keys, cols, values = array("Q"), array("b"), array("f")
+            keys.fromfile(f, count)
+            cols.fromfile(f, count)
+            values.fromfile(f, count)
+        if sys.byteorder == "big":
+            keys.byteswap()
+            values.byteswap()
+        return cls({key: (col, value) for key, col, value in zip(keys, cols, values)})
+
+
+if __name__ == "__main__":
+    import os
+    import time
+
+    start = time.perf_counter()
+    book = build_book(plies=4, rollouts=20000, workers=os.cpu_count())
+    book.save("connectfour.book")
+    print(f"{len(book)} positions in {time.perf_counter() - start:.0f}s")
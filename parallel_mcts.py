@@ -0,0 +1,320 @@
+"""
+Parallel search on top of `MCTS`.
+
+Root parallelization: `RootParallelMCTS` runs several worker processes that
+each grow an independent tree from the same root, with their own random
+seed. The workers only send back the statistics of the root's children,
+which are summed into one `MCTS` that `choose` then reads.
+
+Tree parallelization: `TreeParallelMCTS` lets several threads grow one
+shared tree. It pays off on free-threaded CPython builds; with the GIL the
+threads mostly take turns.
+
+Leaf parallelization: `LeafParallelMCTS` grows a single tree, but every
+leaf is simulated many times at once in a persistent process pool, and the
+averaged reward is backpropagated.
+
+Run this file to print rollouts/sec against the number of workers and
+threads.
+"""
+from concurrent.futures import ProcessPoolExecutor
+import os
+import random
+import threading
+import time
+
+from monte_carlo_tree_search import MCTS
+
+
+def _grow_tree(node, seed, rollouts, time_limit, exploration_weight):
+    "Worker: grow a tree from `node`, return rollouts done and root child stats"
+    random.seed(seed)
+    tree = MCTS(exploration_weight)
+    deadline = None if time_limit is None else time.monotonic() + time_limit
+    done = 0
+    while rollouts is None or done < rollouts:
+        if deadline is not None and time.monotonic() >= deadline:
+            break
+        tree.do_rollout(node)
+        done += 1
+    stats = [
+        (child, tree.Q[child], tree.N[child], tree.terminal.get(child))
+        for child in tree.children.get(node, ())
+    ]
+    return done, stats
+
+
+class RootParallelMCTS:
+    "Root-parallel searcher: independent trees in a process pool, merged at the root."
+
+    def __init__(self, workers=None, exploration_weight=1, seed=None):
+        self.workers = workers or os.cpu_count()
+        self.exploration_weight = exploration_weight
+        self.seed = seed
+        self.tree = MCTS(exploration_weight)  # merged root statistics
+        self.rollouts = 0  # rollouts done by all workers in the last search
+        self._pool = None
+
+    def search(self, node, rollouts=None, time_limit=None):
+        """
+        Search from `node` with `rollouts` in total spread over the workers,
+        for at most `time_limit` seconds of wall-clock time, or both.
+        Returns the number of rollouts done.
+        """
+        if rollouts is None and time_limit is None:
+            raise ValueError("search needs a rollout budget, a time limit or both")
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(self.workers)
+        base_seed = random.getrandbits(32) if self.seed is None else self.seed
+        futures = []
+        for worker in range(self.workers):
+            share = None
+            if rollouts is not None:
+                share = rollouts // self.workers + (worker < rollouts % self.workers)
+            futures.append(
+                self._pool.submit(
+                    _grow_tree,
+                    node,
+                    base_seed + worker,
+                    share,
+                    time_limit,
+                    self.exploration_weight,
+                )
+            )
+
+        self.tree = MCTS(self.exploration_weight)
+        self.rollouts = 0
+        children = set()
+        for future in futures:
+            done, stats = future.result()
+            self.rollouts += done
+            for child, Q, N, proven in stats:
+                children.add(child)
+                self.tree.Q[child] += Q
+                self.tree.N[child] += N
+                if proven is not None:
+                    # Proven values are exact, any worker's proof holds
+                    self.tree.terminal[child] = proven
+        if children:
+            self.tree.children[node] = children
+            self.tree._child_entries = len(children)
+        self.tree.N[node] = self.rollouts
+        return self.rollouts
+
+    def choose(self, node):
+        "Choose the best successor of node from the merged statistics"
+        return self.tree.choose(node)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class TreeParallelMCTS(MCTS):
+    """
+    Searcher whose tree is grown by several threads at once.
+
+    Selection and expansion run under one tree lock. While a thread holds
+    it, every node on its path gets `virtual_loss` extra visits without
+    reward, so the UCT scores steer the next thread to other paths.
+    Simulation runs without locks. Backpropagation takes one lock per node,
+    picked from a fixed set of striped locks, to replace the virtual loss
+    with the real visit and reward.
+    """
+
+    def __init__(self, exploration_weight=1, threads=None, virtual_loss=1, nr_locks=64):
+        super().__init__(exploration_weight)
+        self.threads = threads or os.cpu_count()
+        self.virtual_loss = virtual_loss
+        self._tree_lock = threading.Lock()
+        self._node_locks = [threading.Lock() for _ in range(nr_locks)]
+
+    def do_rollouts(self, node, rollouts, time_limit=None):
+        """
+        Do `rollouts` rollouts from `node` (None for no limit), spread over
+        `threads` threads, for at most `time_limit` seconds. Returns the
+        number of rollouts done.
+        """
+        if rollouts is None:
+            shares = [None] * self.threads
+        else:
+            shares = [
+                rollouts // self.threads + (thread < rollouts % self.threads)
+                for thread in range(self.threads)
+            ]
+        deadline = None if time_limit is None else time.monotonic() + time_limit
+        done = []
+        workers = [
+            threading.Thread(target=self._rollout_loop, args=(node, share, deadline, done))
+            for share in shares
+            if share != 0
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        return sum(done)
+
+    def _rollout_loop(self, node, rollouts, deadline, done):
+        count = 0
+        while rollouts is None or count < rollouts:
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            self.do_rollout(node)
+            count += 1
+        done.append(count)
+
+    def search(self, node, rollouts=None, time_limit=None):
+        "Same as `MCTS.search`, with the rollouts spread over the threads"
+        if rollouts is None and time_limit is None:
+            raise ValueError("search needs a rollout budget, a time limit or both")
+        return self.do_rollouts(node, rollouts, time_limit)
+
+    def do_rollout(self, node):
+        "Make the tree one layer better. Safe to call from several threads."
+        with self._tree_lock:
+            path, dead_end = self._select(node)
+            leaf = path[-1]
+            if dead_end:
+                reward = self._resolve_dead_end(leaf)
+            else:
+                self._expand(leaf)
+                if leaf.is_terminal():
+                    # Record the value now, so other threads never read the
+                    # Q/N of a terminal leaf that only has virtual visits
+                    self.terminal[leaf] = 1 - leaf.reward()
+            for n in path:
+                with self._lock_for(n):
+                    self.N[n] += self.virtual_loss
+        if not dead_end:
+            reward = self._simulate(leaf)
+        self._backpropagate(path, reward)
+
+    def _backpropagate(self, path, reward):
+        "Replace the virtual loss on `path` with one visit and the reward"
+        for node in reversed(path):
+            with self._lock_for(node):
+                self.N[node] += 1 - self.virtual_loss
+                self.Q[node] += reward
+            reward = 1 - reward  # 1 for me is 0 for my enemy, and vice versa
+
+    def _lock_for(self, node):
+        return self._node_locks[hash(node) % len(self._node_locks)]
+
+
+def _leaf_rollouts(node_type, data, rollouts, seed):
+    "Worker: sum of the rewards of `rollouts` random simulations of a node"
+    random.seed(seed)
+    node = node_type.decode(data) if node_type is not None else data
+    tree = MCTS()
+    return sum(tree._simulate(node) for _ in range(rollouts))
+
+
+class LeafParallelMCTS(MCTS):
+    """
+    Searcher that simulates each leaf `rollouts_per_leaf` times in a
+    process pool and backpropagates the mean reward.
+
+    The rollouts are split into one task per worker, so each leaf costs one
+    round trip per worker. Nodes are sent as `type(node)` plus the bytes
+    from `node.encode()`; nodes without an encoding are pickled whole. The
+    pool is started on first use and reused until `close()`.
+    """
+
+    def __init__(self, exploration_weight=1, workers=None, rollouts_per_leaf=None):
+        super().__init__(exploration_weight)
+        self.workers = workers or os.cpu_count()
+        self.rollouts_per_leaf = rollouts_per_leaf or 4 * self.workers
+        self._pool = None
+
+    def _simulate(self, node):
+        "Mean reward of `rollouts_per_leaf` random simulations of `node`"
+        if node.is_terminal():
+            return super()._simulate(node)
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(self.workers)
+        data = node.encode()
+        node_type = type(node) if data is not None else None
+        if data is None:
+            data = node
+        tasks = min(self.workers, self.rollouts_per_leaf)
+        futures = [
+            self._pool.submit(
+                _leaf_rollouts,
+                node_type,
+                data,
+                self.rollouts_per_leaf // tasks + (task < self.rollouts_per_leaf % tasks),
+                random.getrandbits(32),
+            )
+            for task in range(tasks)
+        ]
+        return sum(future.result() for future in futures) / self.rollouts_per_leaf
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def tree_parallel_benchmark(thread_counts=(1, 2, 4, 8), rollouts=20000, games=10):
+    """
+    Print tree-parallel rollouts/sec for each thread count, and the score of
+    the tree-parallel searcher against the serial one at equal rollouts.
+    """
+    from connectfour import BitboardConnectFour, play_match
+
+    game = BitboardConnectFour()
+    for threads in thread_counts:
+        random.seed(0)
+        tree = TreeParallelMCTS(threads=threads)
+        start = time.perf_counter()
+        tree.do_rollouts(game, rollouts)
+        elapsed = time.perf_counter() - start
+        print(f"{threads:3d} threads: {rollouts / elapsed:10.0f} rollouts/sec")
+
+    threads = max(thread_counts)
+    score = 0
+    for i in range(games):
+        random.seed(i)
+        if i % 2 == 0:
+            score += play_match(TreeParallelMCTS(threads=threads), MCTS(), rollouts=1000)
+        else:
+            score += 1 - play_match(MCTS(), TreeParallelMCTS(threads=threads), rollouts=1000)
+    print(f"{threads} threads vs serial, 1000 rollouts/move: {score}/{games}")
+
+
+def scaling_benchmark(worker_counts=(1, 2, 4, 8, 16, 32), time_limit=5.0):
+    """
+    Print root-parallel rollouts/sec on Connect Four for each worker count.
+    Only counts up to the number of cores measure scaling, as more workers
+    share the cores.
+    """
+    from connectfour import BitboardConnectFour
+
+    print(f"{os.cpu_count()} cores")
+    game = BitboardConnectFour()
+    for workers in worker_counts:
+        with RootParallelMCTS(workers, seed=0) as searcher:
+            searcher.search(game, rollouts=workers)  # start the processes
+            start = time.perf_counter()
+            done = searcher.search(game, time_limit=time_limit)
+            elapsed = time.perf_counter() - start
+        print(f"{workers:3d} workers: {done / elapsed:10.0f} rollouts/sec")
+
+
+if __name__ == "__main__":
+    scaling_benchmark()
+    tree_parallel_benchmark()
@@ -0,0 +1,112 @@
+"""
+Counters and per-phase timers for a search, to see where the time goes
+without a profiler.
+
+Pass a `SearchStats` to `MCTS(stats=...)` or `mcts.UCTSEARCH(..., stats=...)`.
+The searcher then wraps its select, expand, simulate and backpropagate
+phases to time them and count, per rollout:
+
+    depth          edges from the root to the selected leaf
+    branching      children of every node selection passed through
+    rollout length moves played by the simulation
+    terminal hits  leaves whose value was already known, so nothing had to
+                   be simulated (a terminal or proven node reached again)
+
+Without stats the phases are not wrapped at all, so a search costs exactly
+what it did before. One `SearchStats` can collect several searches; call
+`reset` to start over.
+"""
+import time
+
+PHASES = ("select", "expand", "simulate", "backpropagate")
+
+
+class SearchStats:
+    "Counters and per-phase timers filled in by an instrumented search"
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.rollouts = 0
+        self.total_depth = 0
+        self.max_depth = 0
+        self.branching_nodes = 0  # nodes that selection passed through
+        self.branching_children = 0  # their children, summed
+        self.simulations = 0
+        self.simulated_moves = 0
+        self.terminal_hits = 0
+        self.seconds = dict.fromkeys(PHASES, 0.0)
+
+    def record_selection(self, depth, child_counts=()):
+        "One rollout whose leaf is `depth` edges deep, with the child counts along the way"
+        self.rollouts += 1
+        self.total_depth += depth
+        if depth > self.max_depth:
+            self.max_depth = depth
+        for count in child_counts:
+            self.branching_nodes += 1
+            self.branching_children += count
+
+    def record_simulation(self, moves, simulations=1):
+        "`simulations` simulations that played `moves` moves each"
+        self.simulations += simulations
+        self.simulated_moves += moves * simulations
+
+    def timed(self, phase, function):
+        "`function` wrapped to add its running time to `seconds[phase]`"
+        seconds = self.seconds
+        clock = time.perf_counter
+
+        def wrapper(*args, **kwargs):
+            start = clock()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                seconds[phase] += clock() - start
+
+        return wrapper
+
+    @property
+    def mean_depth(self):
+        return self.total_depth / self.rollouts if self.rollouts else 0.0
+
+    @property
+    def mean_branching(self):
+        if not self.branching_nodes:
+            return 0.0
+        return self.branching_children / self.branching_nodes
+
+    @property
+    def mean_rollout_length(self):
+        return self.simulated_moves / self.simulations if self.simulations else 0.0
+
+    @property
+    def total_seconds(self):
+        return sum(self.seconds.values())
+
+    def as_dict(self):
+        return {
+            "rollouts": self.rollouts,
+            "mean_depth": self.mean_depth,
+            "max_depth": self.max_depth,
+            "mean_branching": self.mean_branching,
+            "simulations": self.simulations,
+            "mean_rollout_length": self.mean_rollout_length,
+            "terminal_hits": self.terminal_hits,
+            "seconds": dict(self.seconds),
+        }
+
+    def __str__(self):
+        lines = [
+            f"rollouts: {self.rollouts}",
+            f"selection depth: mean {self.mean_depth:.2f}, max {self.max_depth}",
+            f"branching factor: {self.mean_branching:.2f}",
+            f"rollout length: {self.mean_rollout_length:.2f} over {self.simulations} simulations",
+            f"terminal hits: {self.terminal_hits}",
+        ]
+        total = self.total_seconds
+        for phase in PHASES:
+            share = self.seconds[phase] / total if total else 0.0
+            lines.append(f"{phase:>13}: {self.seconds[phase]:8.3f}s {share:6.1%}")
+        return "\n".join(lines)
@@ -0,0 +1,71 @@
+import random
+
+import pytest
+
+from array_mcts import ArrayMCTS
+from connectfour import BitboardConnectFour
+from monte_carlo_tree_search import MCTS
+from TicTacToeChat import TicTacToeBoard
+
+
+def run_both(board, rollouts):
+    random.seed(7)
+    tree = MCTS()
+    for _ in range(rollouts):
+        tree.do_rollout(board)
+    random.seed(7)
+    array_tree = ArrayMCTS()
+    for _ in range(rollouts):
+        array_tree.do_rollout(board)
+    return tree, array_tree
+
+
+def test_same_statistics_as_mcts():
+    for board, rollouts in ((TicTacToeBoard(), 2000), (BitboardConnectFour(), 500)):
+        tree, array_tree = run_both(board, rollouts)
+        for node in tree.N:
+            q, n, proof = array_tree.node_stats(node)
+            assert (q, n) == (tree.Q[node], tree.N[node])
+            assert proof == tree.terminal.get(node)
+        assert sum(1 for p in array_tree.proof if p == p) == len(tree.terminal)
+        assert array_tree.choose(board) == tree.choose(board)
+
+
+def test_proves_tic_tac_toe_endgame():
+    board = TicTacToeBoard(
+        tup=(None, False, None, None, True, None, None, True, None),
+        turn=False,
+    )
+    tree, array_tree = run_both(board, 239 * 2 + 1)
+    assert sum(1 for p in array_tree.proof if p == p) == len(tree.terminal) == 239
+
+
+def test_children_are_stored_contiguously():
+    tree = ArrayMCTS()
+    board = TicTacToeBoard()
+    tree.do_rollout(board)
+    root = tree.ids[board]
+    children = tree.children_of(root)
+    assert len(children) == 9
+    assert {tree.nodes[c] for c in children} == board.find_children()
+    assert tree.memory_usage() > 0
+
+
+def test_vectorized_uct_matches_scalar():
+    pytest.importorskip("numpy")
+    board = BitboardConnectFour()
+    for cls in (MCTS, ArrayMCTS):
+        random.seed(11)
+        tree = cls()
+        for _ in range(300):
+            tree.do_rollout(board)
+        if cls is MCTS:
+            parent, candidates = board, list(tree.children[board])
+        else:
+            parent = tree.ids[board]
+            candidates = list(tree.children_of(parent))
+        scalar = tree._uct_select(parent, candidates)
+        assert tree._uct_select_vectorized(parent, candidates) == scalar
+        tree.VECTORIZE_MIN_CHILDREN = 0
+        for _ in range(100):
+            tree.do_rollout(board)
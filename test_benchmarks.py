@@ -0,0 +1,72 @@
+import json
+
+from benchmarks import CASES, _seed, compare, main, run_all, run_case
+
+
+def test_run_case_metrics():
+    metrics = run_case("mcts/tictactoe", rollouts=50, repeats=3)
+    assert metrics["repeats"] == 3
+    assert metrics["rollouts"] == 50
+    assert metrics["nodes"] > 1
+    assert metrics["rollouts_per_sec"] > 0
+    assert metrics["nodes_per_sec"] > 0
+    assert metrics["peak_memory_bytes"] > 0
+    assert metrics["choose_seconds"] > 0
+    assert set(metrics["spread"]) == {"rollouts_per_sec", "nodes_per_sec", "choose_seconds"}
+    assert all(spread >= 0 for spread in metrics["spread"].values())
+
+
+def test_runs_are_reproducible():
+    for name in CASES:
+        run, count_nodes, _ = CASES[name][1](20)
+        counts = []
+        for _ in range(2):
+            _seed(3)
+            counts.append(count_nodes(run()))
+        assert counts[0] == counts[1]
+
+
+def test_compare_flags_regressions():
+    baseline = run_all(["uctsearch/state"], scale=0.01, repeats=2)
+    assert compare(baseline, baseline) == []
+
+    baseline["results"]["uctsearch/state"]["spread"] = dict.fromkeys(
+        ["rollouts_per_sec", "nodes_per_sec", "choose_seconds"], 0.0
+    )
+    current = json.loads(json.dumps(baseline))
+    metrics = current["results"]["uctsearch/state"]
+    metrics["rollouts_per_sec"] *= 0.5
+    metrics["peak_memory_bytes"] *= 1.1  # within the tolerance
+    metrics["choose_seconds"] *= 2
+    regressions = compare(current, baseline, tolerance=0.2)
+    assert {(name, metric) for name, metric, _, _ in regressions} == {
+        ("uctsearch/state", "rollouts_per_sec"),
+        ("uctsearch/state", "choose_seconds"),
+    }
+    # Improvements are never regressions
+    assert compare(baseline, current, tolerance=0.2) == []
+
+    # A noisy run widens the tolerance of its timings, up to a cap
+    metrics["spread"]["choose_seconds"] = 0.5
+    regressions = compare(current, baseline, tolerance=0.2)
+    assert [metric for _, metric, _, _ in regressions] == [
+        "choose_seconds",
+        "rollouts_per_sec",
+    ]
+    old = baseline["results"]["uctsearch/state"]
+    metrics["choose_seconds"] = old["choose_seconds"] * 1.4
+    regressions = compare(current, baseline, tolerance=0.2)
+    assert [metric for _, metric, _, _ in regressions] == ["rollouts_per_sec"]
+
+
+def test_main_writes_and_compares(tmp_path):
+    path = tmp_path / "results.json"
+    args = ["--cases", "uctsearch/state", "--scale", "0.01", "--repeats", "2"]
+    assert main(args + ["--output", str(path)]) == 0
+    report = json.loads(path.read_text())
+    assert set(report["results"]) == {"uctsearch/state"}
+    assert main(args + ["--baseline", str(path), "--tolerance", "1000"]) == 0
+
+    report["results"]["uctsearch/state"]["rollouts_per_sec"] *= 1e6
+    path.write_text(json.dumps(report))
+    assert main(args + ["--baseline", str(path)]) == 1
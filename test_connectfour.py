@@ -1,4 +1,8 @@
-from connectfour import ConnectFourGame
+import math
+import random
+
+from connectfour import BitboardConnectFour, ConnectFourGame
+from monte_carlo_tree_search import MCTS
 
 
 def test_winner_states():
@@ -16,3 +20,328 @@ def test_winner_states():
     new_board = new_game.make_move(new_board, 2)
     new_board = new_game.make_move(new_board, 3)
     assert simple_game.is_winner(player=PLAYER)
+
+
+def test_bitboard_winner_directions():
+    lines = [
+        [(5, 0), (5, 1), (5, 2), (5, 3)],  # horizontal
+        [(5, 6), (4, 6), (3, 6), (2, 6)],  # vertical
+        [(5, 0), (4, 1), (3, 2), (2, 3)],  # diagonal up-right
+        [(5, 6), (4, 5), (3, 4), (2, 3)],  # diagonal up-left
+    ]
+    for line in lines:
+        board = [[" "] * 7 for _ in range(6)]
+        for row, col in line:
+            board[row][col] = "O"
+        game = BitboardConnectFour.from_board(board)
+        assert game.is_winner("O")
+        assert not game.is_winner("X")
+        assert game.is_terminal()
+        assert game.reward() == 0
+    almost = BitboardConnectFour.from_board([[" "] * 7 for _ in range(5)] + [["X"] * 3 + [" "] * 4])
+    assert not almost.is_terminal()
+
+
+def test_bitboard_matches_list_board():
+    random.seed(3)
+    for _ in range(50):
+        game = ConnectFourGame()
+        bitboard = BitboardConnectFour()
+        while not bitboard.is_terminal():
+            col = random.choice(bitboard.valid_moves())
+            game = ConnectFourGame(game.make_move([row[:] for row in game.board], col), not game.turn)
+            bitboard = bitboard.play(col)
+            assert bitboard.board == game.board
+            assert bitboard == BitboardConnectFour.from_board(game.board, game.turn)
+            assert bitboard.is_winner("X") == game.is_winner("X")
+            assert bitboard.is_winner("O") == game.is_winner("O")
+        assert bitboard.reward() == game.reward()
+
+
+def test_bitboard_children_and_hash():
+    game = BitboardConnectFour()
+    children = game.find_children()
+    assert len(children) == 7
+    assert all(not child.turn for child in children)
+    assert len({hash(child) for child in children}) == 7
+    # Transpositions reach the same key
+    assert game.play(0).play(1).play(2) == game.play(2).play(1).play(0)
+    assert game.play(0).play(1) != game.play(1).play(0)
+
+
+def test_bitboard_drops_into_mcts():
+    random.seed(0)
+    tree = MCTS()
+    game = BitboardConnectFour()
+    for _ in range(200):
+        tree.do_rollout(game)
+    assert tree.N[game] == 200
+    assert tree.choose(game) in game.find_children()
+
+
+def test_zobrist_key_is_incremental():
+    random.seed(5)
+    game = ConnectFourGame()
+    while not game.is_terminal():
+        game = game.find_random_child()
+        assert game.key == ConnectFourGame([row[:] for row in game.board]).key
+    game = ConnectFourGame()
+    game.make_move(game.board, 3)
+    assert game.key == ConnectFourGame([row[:] for row in game.board]).key
+    assert ConnectFourGame().play(3) == game
+
+
+def test_advance_keeps_only_reachable_subtree():
+    random.seed(6)
+    tree = MCTS()
+    game = BitboardConnectFour()
+    tree.search(game, rollouts=2000)
+    played = tree.choose(game)
+    kept = {played}
+    frontier = [played]
+    while frontier:
+        for child in tree.children.get(frontier.pop(), ()):
+            if child not in kept:
+                kept.add(child)
+                frontier.append(child)
+    before = {n: (tree.Q[n], tree.N[n]) for n in kept if n in tree.N}
+    tree.advance(played)
+    assert set(tree.N) <= kept
+    assert set(tree.children) <= kept
+    assert set(tree.terminal) <= kept
+    assert {n: (tree.Q[n], tree.N[n]) for n in tree.N} == before
+
+
+def test_advance_bounds_memory_over_a_game():
+    random.seed(7)
+    tree = MCTS()
+    game = BitboardConnectFour()
+    sizes = []
+    while not game.is_terminal():
+        tree.search(game, rollouts=300)
+        game = tree.choose(game)
+        tree.advance(game)
+        sizes.append(len(tree.N))
+    # Without advance the tree holds over 12,000 nodes by the end
+    assert max(sizes) < 2000
+
+
+def test_node_budget_is_respected():
+    random.seed(8)
+    tree = MCTS(max_nodes=500)
+    game = BitboardConnectFour()
+    for _ in range(3000):
+        tree.do_rollout(game)
+        assert tree.resident_nodes <= 500
+    assert tree.N[game] == 3000
+    assert tree.evictions > 0
+    assert tree.evicted_nodes > 0
+    assert tree.choose(game) in game.find_children()
+
+
+def test_eviction_keeps_parent_statistics():
+    random.seed(9)
+    tree = MCTS()
+    game = BitboardConnectFour()
+    tree.search(game, rollouts=1000)
+    stats = {n: (tree.Q[n], tree.N[n]) for n in tree.children}
+    assert tree.resident_nodes == len(tree.N) + len(tree.terminal) + sum(
+        len(children) for children in tree.children.values()
+    )
+    tree.max_nodes = tree.resident_nodes // 2
+    tree._evict(game)
+    assert tree.resident_nodes <= tree.max_nodes
+    assert tree._child_entries == sum(len(c) for c in tree.children.values())
+    for node in tree.N:
+        if node in stats:
+            assert (tree.Q[node], tree.N[node]) == stats[node]
+
+
+def play_moves(cols):
+    game = BitboardConnectFour()
+    for col in cols:
+        game = game.play(col)
+    return game
+
+
+def test_solver_proves_a_win_and_plays_it():
+    random.seed(10)
+    game = play_moves([3, 3, 2, 2])  # X to move makes an open three and wins
+    tree = MCTS(solver=True)
+    done = tree.search(game, rollouts=5000)
+    assert done < 5000  # the search stops once the root is proven
+    assert tree.terminal[game] == 0  # proven win for X
+    move = tree.choose(game)
+    assert tree.terminal[move] == 0
+    assert move in (game.play(1), game.play(4))
+
+
+def test_solver_proves_a_loss():
+    random.seed(11)
+    game = play_moves([6, 1, 6, 2, 5, 3])  # O threatens both ends of 1-2-3
+    tree = MCTS(solver=True)
+    tree.search(game, rollouts=5000)
+    assert tree.terminal[game] == 1  # proven win for O
+    assert all(tree.terminal[child] == 1 for child in tree.children[game])
+
+
+def test_solver_never_selects_proven_nodes():
+    random.seed(12)
+    game = play_moves([0, 0, 1, 1, 2, 6])  # X wins at 3 right away
+    tree = MCTS(solver=True)
+    tree.do_rollout(game)
+    assert tree.terminal[game] == 0
+    assert tree.choose(game) == game.play(3)
+    assert tree.N[game.play(3)] == 0  # proven at expansion, never simulated
+
+
+def test_tactical_policy_wins_then_blocks():
+    from connectfour import tactical_policy
+
+    random.seed(13)
+    # X to move wins in column 3, O threatens column 3 as well
+    game = play_moves([0, 4, 1, 4, 2, 4])
+    assert tactical_policy(game) == game.play(3)
+    # O to move must block column 3
+    game = play_moves([0, 6, 1, 6, 2])
+    assert tactical_policy(game) == game.play(3)
+    # Same on the list based board
+    slow = ConnectFourGame().play(0).play(6).play(1).play(6).play(2)
+    assert tactical_policy(slow) == slow.play(3)
+    # Without threats any legal column can come out
+    assert tactical_policy(BitboardConnectFour()) in BitboardConnectFour().find_children()
+
+
+def test_tactical_policy_on_scratch_boards():
+    from connectfour import tactical_policy
+
+    random.seed(21)
+    board = play_moves([0, 4, 1, 4, 2, 4]).scratch()
+    assert tactical_policy.move(board) == 3
+    board = play_moves([0, 6, 1, 6, 2]).scratch()
+    assert tactical_policy.move(board) == 3
+    for col in (3, 5, 6):
+        board.apply_move(col)  # O blocks, then gets three in column 6
+    assert tactical_policy.move(board) == 6
+    assert tactical_policy.move(BitboardConnectFour().scratch()) in range(7)
+
+
+def test_search_plays_and_blocks_immediate_wins():
+    from connectfour import tactical_policy
+
+    win = play_moves([0, 1, 0, 1, 0, 2])  # X to move wins in column 0
+    block = play_moves([0, 1, 0, 1, 0])  # O to move must block column 0
+    for policy in (None, tactical_policy):
+        for seed in range(5):
+            random.seed(seed)
+            tree = MCTS(rollout_policy=policy)
+            tree.search(win, rollouts=200)
+            assert tree.choose(win) == win.play(0)
+            tree = MCTS(rollout_policy=policy)
+            tree.search(block, rollouts=400)
+            assert tree.choose(block) == block.play(0)
+
+
+def test_search_with_rollout_policy():
+    from connectfour import tactical_policy
+
+    calls = []
+
+    def policy(node):
+        calls.append(node)
+        return tactical_policy(node)
+
+    random.seed(14)
+    game = play_moves([6, 0, 6, 1, 5, 2])
+    tree = MCTS(rollout_policy=policy)
+    tree.search(game, rollouts=100)
+    assert calls and all(not node.is_terminal() for node in calls)
+    assert tree.N[game] == 100
+    assert tree.choose(game) in game.find_children()
+
+
+def test_lazy_expansion_creates_children_on_demand():
+    random.seed(15)
+    game = BitboardConnectFour()
+    tree = MCTS(lazy_expansion=True)
+    tree.do_rollout(game)
+    assert tree.children[game] == set()
+    for visits in range(1, 8):
+        tree.do_rollout(game)
+        assert len(tree.children[game]) == visits
+    # Center column first
+    assert game.play(3) in tree.children[game]
+    tree.search(game, rollouts=500)
+    assert tree.children[game] == game.find_children()
+    assert tree.N[game] == 508
+    assert sum(tree.N[child] for child in tree.children[game]) == 507
+
+
+def test_choose_before_lazy_children_exist():
+    random.seed(17)
+    game = BitboardConnectFour()
+    tree = MCTS(lazy_expansion=True)
+    tree.search(game, rollouts=1)
+    assert tree.children[game] == set()
+    assert tree.choose(game) in game.find_children()
+
+
+def test_progressive_widening_limits_children():
+    random.seed(16)
+    game = ConnectFourGame()
+    tree = MCTS(widening=0.5)
+    tree.search(game, rollouts=300)
+    for node, children in tree.children.items():
+        assert len(children) <= max(1, math.ceil(tree.N[node] ** 0.5))
+    assert tree.choose(game) in game.find_children()
+
+
+def test_lazy_solver_waits_for_all_children():
+    random.seed(17)
+    game = play_moves([6, 1, 6, 2, 5, 3])  # every X move loses
+    tree = MCTS(solver=True, lazy_expansion=True)
+    tree.search(game, rollouts=5000)
+    assert tree.terminal[game] == 1
+    assert len(tree.children[game]) == 7
+
+
+def test_scratch_apply_and_undo():
+    random.seed(18)
+    for node in (BitboardConnectFour(), ConnectFourGame()):
+        board = node.scratch()
+        played, nodes = [], [node]
+        while not board.is_terminal():
+            col = random.choice(board.legal_moves())
+            board.apply_move(col)
+            played.append(col)
+            nodes.append(nodes[-1].play(col))
+            assert board.to_node() == nodes[-1]
+            assert type(board.to_node()) is type(node)
+        assert board.reward() == nodes[-1].reward()
+        for col in reversed(played):
+            board.undo_move(col)
+            nodes.pop()
+            assert board.to_node() == nodes[-1]
+            assert board.legal_moves() == [
+                col for col in range(7) if nodes[-1].is_valid_move(col)
+            ]
+        assert not board.is_terminal()
+
+
+def test_scratch_rollouts_match_node_rollouts(monkeypatch):
+    game = BitboardConnectFour()
+    random.seed(19)
+    tree = MCTS()
+    tree.search(game, rollouts=500)
+    monkeypatch.setattr(BitboardConnectFour, "scratch", lambda self: None)
+    random.seed(19)
+    plain = MCTS()
+    plain.search(game, rollouts=500)
+    assert tree.N == plain.N and tree.Q == plain.Q and tree.terminal == plain.terminal
+
+
+def test_move_to():
+    game = ConnectFourGame().play(3).play(3)
+    assert game.move_to(game.play(5)) == 5
+    bitboard = play_moves([3, 3])
+    assert all(bitboard.move_to(bitboard.play(col)) == col for col in range(7))
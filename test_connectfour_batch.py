@@ -0,0 +1,108 @@
+import random
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from connectfour import BitboardConnectFour, ConnectFourGame  # noqa: E402
+from connectfour_batch import simulate_batch  # noqa: E402
+from monte_carlo_tree_search import MCTS  # noqa: E402
+
+
+def test_terminal_and_forced_positions():
+    random.seed(1)
+    won = BitboardConnectFour()
+    for col in (0, 1, 0, 1, 0, 1, 0):
+        won = won.play(col)
+    assert won.is_terminal()
+    # One empty cell left: the game ends after exactly one ply
+    while True:
+        game = BitboardConnectFour()
+        while not game.is_terminal() and game.nr_moves < 41:
+            game = game.find_random_child()
+        if not game.is_terminal():
+            break
+    final = game.find_random_child()
+    rewards = simulate_batch([won, game, game])
+    # Rewards are for the player who moved into the position
+    assert rewards[0] == won.reward() == 1
+    expected = 1 - final.reward() if game.turn else final.reward()
+    assert list(rewards[1:]) == [expected] * 2
+
+
+def test_matches_scalar_simulation():
+    random.seed(2)
+    tree = MCTS()
+    start = BitboardConnectFour().play(3).play(3).play(2)
+    scalar = sum(tree._simulate(start) for _ in range(3000)) / 3000
+    batched = simulate_batch([start] * 3000, np.random.default_rng(2)).mean()
+    assert abs(scalar - batched) < 0.05
+    list_board = ConnectFourGame(start.board, start.turn)
+    assert 0 <= simulate_batch([list_board])[0] <= 1
+
+
+def test_batch_rollouts_keep_tree_consistent():
+    random.seed(3)
+    tree = MCTS(batch_simulator=simulate_batch, batch_size=32)
+    board = BitboardConnectFour()
+    for _ in range(20):
+        tree.do_batch_rollout(board)
+    assert tree.N[board] == 20 * 32
+    assert sum(tree.N[child] for child in tree.children[board]) == tree.N[board] - 1
+    assert all(0 <= tree.Q[n] <= tree.N[n] for n in tree.N)
+    assert tree.choose(board) in board.find_children()
+
+
+def test_batch_search_keeps_to_the_rollout_budget():
+    random.seed(4)
+    board = BitboardConnectFour()
+    tree = MCTS(batch_simulator=simulate_batch, batch_size=16)
+    assert tree.search(board, rollouts=10) == 10
+    assert tree.N[board] == 10
+    snapshots = list(tree.search_iter(board, rollouts=40, every=16))
+    assert [s.rollouts for s in snapshots] == [16, 32, 40]
+    assert tree.N[board] == 50
+
+
+def test_batch_search_stats():
+    from search_stats import SearchStats
+
+    random.seed(5)
+    board = BitboardConnectFour()
+    lengths = []
+    simulate_batch([board, board.play(3)], lengths=lengths)
+    assert len(lengths) == 2 and 7 <= lengths[0] <= 42 and 6 <= lengths[1] <= 41
+
+    stats = SearchStats()
+    tree = MCTS(batch_simulator=simulate_batch, batch_size=16, stats=stats)
+    tree.search(board, rollouts=200)
+    assert stats.rollouts == 200
+    assert stats.simulations == 200
+    assert stats.mean_rollout_length > 6
+    assert stats.seconds["simulate"] > 0 and stats.seconds["backpropagate"] > 0
+
+
+def test_default_rng_follows_random_seed():
+    board = BitboardConnectFour()
+    random.seed(6)
+    first = simulate_batch([board] * 20)
+    random.seed(6)
+    assert list(simulate_batch([board] * 20)) == list(first)
+
+
+def test_batch_solver_proves_dead_ends_up_the_path():
+    game = BitboardConnectFour()
+    win = 0 if game.turn else 1  # in the scale of score, for the player to move
+    tree = MCTS(solver=True, batch_simulator=simulate_batch, batch_size=1)
+    tree._expand(game)
+    child, *others = tree.children[game]
+    for other in others:
+        tree.terminal[other] = 1 - win
+    tree.N[game] = tree.N[child] = 1
+    # Every reply to `child` is proven lost for its mover, so it is a dead end
+    tree._expand(child)
+    for grandchild in tree.children[child]:
+        tree.terminal[grandchild] = win
+    tree.do_batch_rollout(game)
+    assert tree.terminal[child] == win
+    assert tree.terminal[game] == win
@@ -0,0 +1,139 @@
+import random
+
+import pytest
+
+import mcts
+from mcts import (
+    BESTCHILD,
+    BESTCHILD_VECTOR,
+    DEFAULTPOLICY,
+    DEFAULTPOLICY_VECTOR,
+    EXPAND,
+    Node,
+    State,
+    UCTSEARCH,
+    UCTSEARCH_PARALLEL,
+)
+
+
+def test_state_history_is_shared():
+    root = State()
+    child = root.play(20)
+    grandchild = child.play(-18)
+    assert grandchild.moves == [20, -18]
+    assert grandchild.history[1] is child.history
+    assert grandchild.value == 2
+    assert grandchild.turn == State.NUM_TURNS - 2
+
+
+def test_state_equality_is_structural():
+    a = State().play(20).play(-18)
+    b = State(moves=[20, -18], value=2, turn=State.NUM_TURNS - 2)
+    assert a == b
+    assert hash(a) == hash(b)
+    c = State().play(-20).play(18)
+    assert a != c
+    assert State().play(20) != State().play(-20)
+
+
+def test_deep_rollout():
+    class DeepState(State):
+        NUM_TURNS = 5000
+
+    state = DeepState(turn=DeepState.NUM_TURNS)
+    while not state.terminal():
+        state = state.next_state()
+    assert len(state.moves) == DeepState.NUM_TURNS
+
+
+def test_uctsearch_returns_child():
+    random.seed(1)
+    root = Node(State())
+    best = UCTSEARCH(200, root)
+    assert best in root.children
+    assert best.state.turn == State.NUM_TURNS - 1
+
+
+def test_expand_tries_every_move_once():
+    class WideState(State):
+        MOVES = list(range(1, 65))
+        num_moves = len(MOVES)
+
+    random.seed(2)
+    root = Node(WideState())
+    while not root.fully_expanded():
+        EXPAND(root)
+    assert len(root.children) == 64
+    assert len({child.state for child in root.children}) == 64
+    assert root.untried == []
+
+
+def test_children_keep_the_state_class():
+    class WideState(State):
+        MOVES = list(range(1, 65))
+        num_moves = len(MOVES)
+
+    grandchild = WideState().next_state().next_state()
+    assert type(grandchild) is WideState
+    assert len(grandchild.legal_moves()) == 64
+    assert grandchild.legal_moves() == [m * grandchild.turn for m in WideState.MOVES]
+
+
+def test_vectorized_bestchild_matches_scalar(monkeypatch):
+    pytest.importorskip("numpy")
+    random.seed(3)
+    root = Node(State())
+    UCTSEARCH(500, root)
+    scalar = BESTCHILD(root, 0)
+    assert BESTCHILD_VECTOR(root, 0) == scalar
+    monkeypatch.setattr(mcts, "VECTOR_MIN_CHILDREN", 0)
+    assert BESTCHILD(root, 0) == scalar
+
+
+def test_vector_policy_matches_default_policy(monkeypatch):
+    random.seed(4)
+    state = State().play(20).play(-27)
+    expected = sum(DEFAULTPOLICY(state) for _ in range(4000)) / 4000
+    assert abs(sum(DEFAULTPOLICY_VECTOR(state, 4000)) / 4000 - expected) < 0.01
+    monkeypatch.setattr(mcts, "np", None)
+    assert abs(sum(DEFAULTPOLICY_VECTOR(state, 4000)) / 4000 - expected) < 0.01
+    final = State(moves=[1] * State.NUM_TURNS, value=10, turn=0)
+    assert list(DEFAULTPOLICY_VECTOR(final, 3)) == [final.reward()] * 3
+
+
+def test_vector_policy_is_reproducible():
+    state = State().play(20)
+    random.seed(7)
+    first = DEFAULTPOLICY_VECTOR(state, 50)
+    random.seed(7)
+    assert list(DEFAULTPOLICY_VECTOR(state, 50)) == list(first)
+
+    visits = []
+    for _ in range(2):
+        random.seed(8)
+        root = Node(State())
+        UCTSEARCH(100, root, rollouts_per_leaf=8)
+        visits.append([(c.state, c.visits, c.reward) for c in root.children])
+    assert visits[0] == visits[1]
+
+
+def test_uctsearch_several_rollouts_per_leaf():
+    random.seed(5)
+    root = Node(State())
+    best = UCTSEARCH(200, root, rollouts_per_leaf=16)
+    assert best in root.children
+    assert 0 < best.reward <= best.visits
+
+
+def test_parallel_uctsearch_merges_root_children():
+    root = Node(State())
+    best = UCTSEARCH_PARALLEL(400, root, workers=2, seed=6)
+    assert best in root.children
+    assert len(root.children) == len({c.state for c in root.children}) <= State.num_moves
+    assert root.visits == 1 + sum(c.visits for c in root.children)
+
+
+def test_uctsearch_time_limit():
+    root = Node(State())
+    UCTSEARCH(None, root, time_limit=0.05)
+    assert root.visits > 1
@@ -0,0 +1,57 @@
+import random
+
+from connectfour import BitboardConnectFour, ConnectFourGame
+from monte_carlo_tree_search import MCTS
+from opening_book import OpeningBook, build_book, opening_positions, position_key
+
+
+def test_opening_positions():
+    assert len(opening_positions(1)) == 1
+    assert len(opening_positions(3)) == 1 + 7 + 49
+
+
+def test_keys_match_between_board_types():
+    game = ConnectFourGame().play(3).play(2).play(3)
+    bitboard = BitboardConnectFour().play(3).play(2).play(3)
+    assert position_key(game) == position_key(bitboard)
+    assert position_key(game) != position_key(ConnectFourGame().play(3))
+
+
+def test_build_save_and_load(tmp_path):
+    book = build_book(plies=2, rollouts=200, seed=1)
+    assert len(book) == 8
+    path = tmp_path / "test.book"
+    book.save(path)
+    loaded = OpeningBook.load(path)
+    for key, (col, value) in book.entries.items():
+        assert loaded.entries[key][0] == col
+        assert abs(loaded.entries[key][1] - value) < 1e-6
+    assert build_book(plies=2, rollouts=200, workers=2, seed=1).entries == book.entries
+
+
+def test_book_plays_immediate_wins():
+    x_wins = BitboardConnectFour()
+    for col in (0, 1, 0, 1, 0, 2):
+        x_wins = x_wins.play(col)
+    o_wins = x_wins.play(6).play(1).play(6)  # O has three in column 1
+    book = build_book(rollouts=200, positions=[x_wins, o_wins])
+    assert book.lookup(x_wins) == x_wins.play(0)
+    assert book.value(x_wins) == 0  # the value for O, as in MCTS.score
+    assert book.lookup(o_wins) == o_wins.play(1)
+    assert book.value(o_wins) == 1
+
+
+def test_choose_plays_book_moves_without_search():
+    book = build_book(plies=2, rollouts=200, seed=2)
+    tree = MCTS(book=book)
+    game = ConnectFourGame()
+    move = tree.choose(game)
+    assert move == book.lookup(game)
+    assert game in book
+    assert len(tree.N) == 0
+    # Out of the book, choose falls back to the tree
+    game = game.play(0).play(0)
+    assert game not in book
+    random.seed(3)
+    tree.search(game, rollouts=50)
+    assert tree.choose(game) in game.find_children()
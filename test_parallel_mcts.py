@@ -0,0 +1,93 @@
+import random
+
+from connectfour import BitboardConnectFour
+from parallel_mcts import LeafParallelMCTS, RootParallelMCTS, TreeParallelMCTS
+from TicTacToeChat import TicTacToeBoard
+
+
+def test_root_parallel_merges_worker_trees():
+    with RootParallelMCTS(workers=2, seed=1) as searcher:
+        board = TicTacToeBoard()
+        assert searcher.search(board, rollouts=101) == 101
+        tree = searcher.tree
+        # The first rollout of each worker only expands the root
+        assert sum(tree.N[child] for child in tree.children[board]) == 101 - 2
+
+        board = TicTacToeBoard(
+            tup=(True, True, None, False, False, True, None, False, False),
+            turn=True,
+        )
+        searcher.search(board, rollouts=100)
+        assert searcher.choose(board).tup[2] is True
+
+
+def test_root_parallel_time_limit():
+    random.seed(2)
+    game = BitboardConnectFour()
+    with RootParallelMCTS(workers=2) as searcher:
+        done = searcher.search(game, time_limit=0.2)
+        assert done > 0
+        assert searcher.choose(game) in game.find_children()
+
+
+class CountingTree(TreeParallelMCTS):
+    "Counts the node visits that backpropagation hands out"
+
+    visits = 0
+
+    def _backpropagate(self, path, reward):
+        with self._tree_lock:
+            self.visits += len(path)
+        super()._backpropagate(path, reward)
+
+
+def test_tree_parallel_statistics_add_up():
+    random.seed(3)
+    board = TicTacToeBoard()
+    tree = CountingTree(threads=4)
+    tree.do_rollouts(board, 2000)
+    assert tree.N[board] == 2000
+    # No virtual loss is left behind and no update is lost
+    assert sum(tree.N.values()) == tree.visits
+    assert all(0 <= tree.Q[n] <= tree.N[n] for n in tree.N)
+
+
+def test_tree_parallel_finds_winning_move():
+    random.seed(4)
+    board = TicTacToeBoard(
+        tup=(True, True, None, False, False, True, None, False, False),
+        turn=True,
+    )
+    tree = TreeParallelMCTS(threads=3)
+    tree.do_rollouts(board, 100)
+    assert tree.choose(board).tup[2] is True
+
+
+def test_leaf_parallel_averages_worker_rollouts():
+    random.seed(5)
+    game = BitboardConnectFour()
+    with LeafParallelMCTS(workers=2, rollouts_per_leaf=9) as tree:
+        for _ in range(20):
+            tree.do_rollout(game)
+        pool = tree._pool
+        tree.do_rollout(game)
+        assert tree._pool is pool
+        assert tree.N[game] == 21
+        assert any(tree.Q[n] % 0.5 for n in tree.N)  # averaged rewards
+        assert tree.choose(game) in game.find_children()
+
+
+class PlainBoard(TicTacToeBoard):
+    "A board that has to be pickled whole"
+
+    def encode(self):
+        return None
+
+
+def test_leaf_parallel_without_encoding():
+    random.seed(6)
+    with LeafParallelMCTS(workers=2, rollouts_per_leaf=4) as tree:
+        board = PlainBoard()
+        for _ in range(3):
+            tree.do_rollout(board)
+        assert tree.N[board] == 3
@@ -0,0 +1,91 @@
+import random
+
+import mcts
+from connectfour import BitboardConnectFour
+from monte_carlo_tree_search import MCTS
+from search_stats import PHASES, SearchStats
+from TicTacToeChat import TicTacToeBoard
+
+
+def test_record_and_summary():
+    stats = SearchStats()
+    stats.record_selection(2, [7, 7])
+    stats.record_selection(4, [7, 6, 5, 4])
+    stats.record_simulation(10)
+    stats.record_simulation(3, simulations=3)
+    assert stats.rollouts == 2
+    assert stats.mean_depth == 3
+    assert stats.max_depth == 4
+    assert stats.mean_branching == 6
+    assert stats.simulations == 4
+    assert stats.mean_rollout_length == 19 / 4
+    assert set(stats.as_dict()["seconds"]) == set(PHASES)
+    assert "rollouts: 2" in str(stats)
+    stats.reset()
+    assert stats.rollouts == 0 and stats.mean_depth == 0
+
+
+def test_timed_adds_running_time():
+    stats = SearchStats()
+    assert stats.timed("simulate", lambda x: x + 1)(1) == 2
+    assert stats.seconds["simulate"] > 0
+
+
+def test_mcts_stats_do_not_change_the_search():
+    game = BitboardConnectFour()
+    random.seed(3)
+    plain = MCTS()
+    plain.search(game, rollouts=500)
+    assert "_select" not in vars(plain)
+
+    random.seed(3)
+    stats = SearchStats()
+    tree = MCTS(stats=stats)
+    tree.search(game, rollouts=500)
+    assert tree.N == plain.N and tree.Q == plain.Q
+
+    assert stats.rollouts == 500
+    assert stats.simulations == 500
+    assert 0 < stats.mean_depth <= stats.max_depth
+    assert stats.mean_branching == 7
+    assert 0 < stats.mean_rollout_length <= 42
+    assert all(stats.seconds[phase] > 0 for phase in PHASES)
+
+
+def test_mcts_stats_count_terminal_hits():
+    stats = SearchStats()
+    tree = MCTS(stats=stats)
+    board = TicTacToeBoard(
+        tup=(True, True, None, False, False, True, None, False, False),
+        turn=True,
+    )
+    tree.search(board, rollouts=50)
+    # Both moves end the game, so after the first visits every leaf is known
+    assert stats.terminal_hits > 40
+
+
+def test_uctsearch_stats_do_not_change_the_search():
+    random.seed(5)
+    plain = mcts.Node(mcts.State())
+    mcts.UCTSEARCH(1000, plain)
+
+    random.seed(5)
+    root = mcts.Node(mcts.State())
+    stats = SearchStats()
+    mcts.UCTSEARCH(1000, root, stats=stats)
+    assert [c.visits for c in root.children] == [c.visits for c in plain.children]
+
+    assert stats.rollouts == 1000
+    assert stats.simulations == 1000
+    assert 1 <= stats.mean_depth <= stats.max_depth <= mcts.State.NUM_TURNS
+    assert 0 < stats.mean_branching <= len(mcts.State.MOVES)
+    assert stats.mean_rollout_length < mcts.State.NUM_TURNS
+    assert all(stats.seconds[phase] > 0 for phase in PHASES)
+
+
+def test_uctsearch_stats_rollouts_per_leaf():
+    random.seed(6)
+    stats = SearchStats()
+    mcts.UCTSEARCH(100, mcts.Node(mcts.State()), rollouts_per_leaf=4, stats=stats)
+    assert stats.rollouts == 100
+    assert stats.simulations == 400
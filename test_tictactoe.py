@@ -1,3 +1,5 @@
+import time
+
 from monte_carlo_tree_search import MCTS
 from TicTacToeChat import TicTacToeBoard
 
@@ -53,12 +55,15 @@ def test_leafs_consistent():
         tree.do_rollout(board)
         for child in tree.children:
             if child.is_terminal():
+                # Q/N is for the player who moved into the node, score for False
                 if child.winner is None:
                     assert tree.Q[child] / tree.N[child] == 0.5
                 elif child.winner:
-                    assert tree.Q[child] / tree.N[child] == 0
+                    assert tree.Q[child] / tree.N[child] == 1
+                    assert tree.score(child) == 0
                 elif not child.winner:
                     assert tree.Q[child] / tree.N[child] == 1
+                    assert tree.score(child) == 1
                 else:
                     assert False, "Should never happen"
 
@@ -77,17 +82,15 @@ def test_leafs_consistent2():
     for child in tree.N:
         if child.is_terminal():
             if tree.N[child] > 0:
+                value = tree.Q[child] / tree.N[child]
                 if child.winner is None:
-                    assert tree.Q[child] / tree.N[child] == 0.5
-                elif child.winner:
-                    assert tree.Q[child] / tree.N[child] == 0
-                else:
-                    assert tree.Q[child] / tree.N[child] == 1
-                assert tree.terminal[child] == tree.Q[child] / tree.N[child]
-                if child.turn:
-                    assert tree.Q[child] / tree.N[child] == 1
+                    assert value == 0.5
                 else:
-                    assert tree.Q[child] / tree.N[child] == 0
+                    # Only the player who just moved can have won
+                    assert value == 1
+                assert tree.terminal[child] == (value if child.turn else 1 - value)
+                if child.winner is not None:
+                    assert tree.terminal[child] == (1 if child.turn else 0)
 
 
 def test_all_runs_accounted():
@@ -483,3 +486,70 @@ def test_find_winning_move8():
             assert tree.terminal[child] == 0
         else:
             assert False, f"This choice {choice} should never happen!"
+
+
+def test_zobrist_key_is_incremental():
+    board = TicTacToeBoard()
+    for row, col in [(1, 1), (0, 0), (2, 1), (0, 2)]:
+        board = board.make_move(row, col)
+        assert board.key == TicTacToeBoard([r[:] for r in board.board], board.turn).key
+    children = board.find_children()
+    assert len(children) == 5
+    assert all(child.key == TicTacToeBoard([r[:] for r in child.board]).key for child in children)
+    assert board == TicTacToeBoard(tup=board.tup, turn=board.turn)
+
+
+def test_search_rollout_budget_and_time_limit():
+    board = TicTacToeBoard()
+    tree = MCTS()
+    assert tree.search(board, rollouts=250) == 250
+    assert tree.N[board] == 250
+    start = time.monotonic()
+    done = tree.search(board, time_limit=0.1)
+    assert done > 0
+    assert time.monotonic() - start < 0.5
+    assert tree.N[board] == 250 + done
+
+
+def test_search_iter_snapshots():
+    board = TicTacToeBoard()
+    tree = MCTS()
+    snapshots = list(tree.search_iter(board, rollouts=1000, every=300))
+    assert [s.rollouts for s in snapshots] == [300, 600, 900, 1000]
+    last = snapshots[-1]
+    assert last.best_move == tree.choose(board)
+    assert sum(last.visits.values()) == tree.N[board] - 1
+    assert last.rollouts_per_sec > 0
+    # A snapshot taken after the last rollout is not repeated
+    tree = MCTS()
+    snapshots = list(tree.search_iter(board, rollouts=900, every=300))
+    assert [s.rollouts for s in snapshots] == [300, 600, 900]
+
+
+
+def test_search_from_a_finished_game():
+    board = TicTacToeBoard()
+    for row, col in [(0, 0), (1, 0), (0, 1), (1, 1), (0, 2)]:
+        board = board.make_move(row, col)
+    assert board.is_terminal()
+    tree = MCTS()
+    assert tree.search(board, rollouts=1) == 1
+    snapshots = list(tree.search_iter(board, rollouts=10, every=5))
+    assert [s.best_move for s in snapshots] == [None, None]
+    assert tree.N[board] == 11
+
+def test_boards_are_immutable_and_cache_their_status():
+    rows = [["X", "X", " "], ["O", "O", " "], [" ", " ", " "]]
+    board = TicTacToeBoard(rows, turn=True)
+    assert rows[0][2] == " " and board.board[0] == ("X", "X", " ")
+    child = board.make_move(0, 2)
+    assert child.winner is True and child.terminal and child.is_terminal()
+    assert board.winner is None and not board.terminal
+    assert child.tup is child.tup  # computed once
+    assert child.tup[6] is True  # tup is column-major
+    try:
+        child.turn = False
+    except AttributeError:
+        pass
+    else:
+        assert False, "boards must be immutable"
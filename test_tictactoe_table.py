@@ -0,0 +1,56 @@
+import random
+
+import tictactoe
+from TicTacToeChat import TicTacToeBoard
+from tictactoe_table import CHILDREN, CODES, MOVES, TERMINAL, WINNER, cells_of
+
+
+def reachable_codes():
+    seen = {0: True}  # code -> turn
+    frontier = [0]
+    while frontier:
+        code = frontier.pop()
+        turn = seen[code]
+        for child in CHILDREN[turn][code] if MOVES[code] else ():
+            if child not in seen:
+                seen[child] = not turn
+                frontier.append(child)
+    return seen
+
+
+def test_reachable_positions():
+    codes = reachable_codes()
+    assert len(codes) == 5478
+    assert sum(TERMINAL[code] for code in codes) == 958
+    assert sum(WINNER[code] is True for code in codes) == 626
+
+
+def test_tables_agree_with_boards():
+    random.seed(0)
+    for code in random.sample(sorted(reachable_codes()), 300):
+        cells = cells_of(code)
+        tup = tuple({0: None, 1: True, 2: False}[value] for value in cells)
+        assert CODES[tup] == code
+        marks = [" XO"[value] for value in cells]
+        board = TicTacToeBoard([marks[0:3], marks[3:6], marks[6:9]])
+        assert board.code == code
+        assert board.winner is WINNER[code]
+        assert board.is_terminal() == TERMINAL[code]
+        assert tictactoe._find_winner(tup) is WINNER[code]
+
+
+def test_scratch_matches_both_boards():
+    random.seed(1)
+    for node in (TicTacToeBoard(), tictactoe.TicTacToeBoard((None,) * 9, True, None, False)):
+        board = node.scratch()
+        played = []
+        while not board.is_terminal():
+            move = random.choice(board.legal_moves())
+            board.apply_move(move)
+            played.append(move)
+        final = board.to_node()
+        assert type(final) is type(node)
+        assert final.is_terminal() and final.reward() == board.reward()
+        for move in reversed(played):
+            board.undo_move(move)
+        assert board.to_node() == node
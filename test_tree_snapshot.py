@@ -0,0 +1,63 @@
+import random
+
+import pytest
+
+from connectfour import BitboardConnectFour, ConnectFourGame
+from monte_carlo_tree_search import MCTS
+import tictactoe
+import TicTacToeChat
+from tree_snapshot import load_tree, save_tree
+
+
+def assert_same_tree(tree, loaded):
+    assert loaded.children == tree.children
+    assert loaded.terminal == tree.terminal
+    for node in tree.N:
+        assert (loaded.Q[node], loaded.N[node]) == (tree.Q[node], tree.N[node])
+
+
+@pytest.mark.parametrize(
+    "root",
+    [
+        ConnectFourGame(),
+        BitboardConnectFour(),
+        TicTacToeChat.TicTacToeBoard(),
+        tictactoe.TicTacToeBoard((None,) * 9, True, None, False),
+    ],
+)
+def test_round_trip(tmp_path, root):
+    random.seed(1)
+    tree = MCTS()
+    tree.search(root, rollouts=300)
+    path = tmp_path / "tree.bin"
+    save_tree(tree, path)
+    with load_tree(path, type(root)) as snapshot:
+        assert snapshot.stats(root) == (tree.Q[root], tree.N[root], None)
+        assert set(snapshot.children(root)) == tree.children[root]
+        assert snapshot.choose(root) == tree.choose(root)
+        assert_same_tree(tree, snapshot.to_mcts())
+
+
+def test_lookup_of_unknown_nodes(tmp_path):
+    random.seed(2)
+    tree = MCTS()
+    game = ConnectFourGame()
+    tree.search(game, rollouts=50)
+    path = tmp_path / "tree.bin"
+    save_tree(tree, path)
+    with load_tree(path, ConnectFourGame) as snapshot:
+        assert len(snapshot) >= len(tree.N)
+        far = game.play(0).play(0).play(0).play(0)
+        assert snapshot.find(far) is None
+        assert snapshot.stats(far) == (0, 0, None)
+        assert snapshot.children(far) is None
+        assert snapshot.choose(far) in far.find_children()
+
+
+def test_wrong_node_type_is_rejected(tmp_path):
+    tree = MCTS()
+    tree.search(TicTacToeChat.TicTacToeBoard(), rollouts=10)
+    path = tmp_path / "tree.bin"
+    save_tree(tree, path)
+    with pytest.raises(ValueError):
+        load_tree(path, tictactoe.TicTacToeBoard)
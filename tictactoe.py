@@ -23,8 +23,10 @@ terminal=False # No legal moves
 """
 
 from collections import namedtuple
+from functools import lru_cache
 from random import choice, seed
 from monte_carlo_tree_search import MCTS, Node
+from tictactoe_table import CODES, MOVES, TERMINAL, WINNER, TicTacToeScratch, cells_of
 
 _TTTB = namedtuple("TicTacToeBoard", "tup turn winner terminal")
 
@@ -36,16 +38,25 @@ class TicTacToeBoard(_TTTB, Node):
         if board.terminal:  # If the game is finished then no moves can be made
             return set()
         # Otherwise, you can make a move in each of the empty spots
-        return {
-            board.make_move(i) for i, value in enumerate(board.tup) if value is None
-        }
+        return {board.make_move(i) for i in MOVES[CODES[board.tup]]}
+
+    def iter_children(board):
+        return (board.make_move(i) for i in MOVES[CODES[board.tup]])
 
     def find_random_child(board):
         seed(42)
         if board.terminal:
             return None  # If the game is finished then no moves can be made
-        empty_spots = [i for i, value in enumerate(board.tup) if value is None]
-        return board.make_move(choice(empty_spots))
+        return board.make_move(choice(MOVES[CODES[board.tup]]))
+
+    def move_to(board, child):
+        for i, (value, child_value) in enumerate(zip(board.tup, child.tup)):
+            if value != child_value:
+                return i
+        return None
+
+    def scratch(board):
+        return TicTacToeScratch(CODES[board.tup], board.turn, _board_from_code)
 
     def reward(board):
         if not board.terminal:
@@ -66,9 +77,21 @@ class TicTacToeBoard(_TTTB, Node):
     def make_move(board, index):
         tup = board.tup[:index] + (board.turn,) + board.tup[index + 1 :]
         turn = not board.turn
-        winner = _find_winner(tup)
-        is_terminal = (winner is not None) or not any(v is None for v in tup)
-        return TicTacToeBoard(tup, turn, winner, is_terminal)
+        code = CODES[tup]
+        return TicTacToeBoard(tup, turn, WINNER[code], TERMINAL[code])
+
+    def encode(board):
+        to_char = lambda v: ("X" if v is True else ("O" if v is False else " "))
+        cells = "".join(to_char(v) for v in board.tup)
+        return (cells + to_char(board.turn)).encode("ascii")
+
+    @classmethod
+    def decode(cls, data):
+        to_value = {"X": True, "O": False, " ": None}
+        values = [to_value[char] for char in data.decode("ascii")]
+        tup, turn = tuple(values[:9]), values[9]
+        code = CODES[tup]
+        return cls(tup, turn, WINNER[code], TERMINAL[code])
 
     def to_pretty_string(board):
         to_char = lambda v: ("X" if v is True else ("O" if v is False else " "))
@@ -85,26 +108,15 @@ class TicTacToeBoard(_TTTB, Node):
         return self.to_pretty_string()
 
 
-def _winning_combos():
-    for start in range(0, 9, 3):  # three in a row
-        yield (start, start + 1, start + 2)
-    for start in range(3):  # three in a column
-        yield (start, start + 3, start + 6)
-    yield (0, 4, 8)  # down-right diagonal
-    yield (2, 4, 6)  # down-left diagonal
+@lru_cache(maxsize=None)  # boards are immutable, so they can be shared
+def _board_from_code(code, turn):
+    tup = tuple((None, True, False)[value] for value in cells_of(code))
+    return TicTacToeBoard(tup, turn, WINNER[code], TERMINAL[code])
 
 
 def _find_winner(tup):
     "Returns None if no winner, True if X wins, False if O wins"
-    for i1, i2, i3 in _winning_combos():
-        v1, v2, v3 = tup[i1], tup[i2], tup[i3]
-        if None in (v1, v2, v3):
-            continue
-        if not v1 and not v2 and not v3:
-            return False
-        if v1 and v2 and v3:
-            return True
-    return None
+    return WINNER[CODES[tup]]
 
 
 def play_game():
@@ -118,14 +130,15 @@ def play_game():
         if board.tup[index] is not None:
             raise RuntimeError("Invalid move")
         board = board.make_move(index)
+        tree.advance(board)
         print(board.to_pretty_string())
         if board.terminal:
             break
         # You can train as you go, or only at the beginning.
-        # Here, we train as we go, doing fifty rollouts each turn.
-        for _ in range(1000):
-            tree.do_rollout(board)
+        # Here, we train as we go, doing a thousand rollouts each turn.
+        tree.search(board, rollouts=1000)
         board = tree.choose(board)
+        tree.advance(board)
         print(board)
         if board.terminal:
             break
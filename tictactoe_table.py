@@ -0,0 +1,116 @@
+"""
+Precomputed tables for every tic-tac-toe position.
+
+A position is coded as a small int in base 3: cell `i` (row-major, 0 to 8)
+adds `value * 3**i`, with value 0 for empty, 1 for X and 2 for O. All 3**9
+codes are tabulated once at import, legal or not, so the tables are plain
+tuples indexed by the code:
+
+    WINNER[code]          True if X has three in a row, False for O, else None
+    TERMINAL[code]        True if the game is over (a winner or a full board)
+    FREE[code]            indices of the empty cells
+    MOVES[code]           the legal moves: FREE[code], or () if the game is over
+    CHILDREN[turn][code]  code after marking each cell of FREE[code], for X
+                          (turn True) or O (turn False) to move
+
+`CODES` maps the `tictactoe.TicTacToeBoard` style tuple of None, True and
+False values to its code, so a board can be looked up with one dict probe.
+`TicTacToeScratch` plays moves on a code in place, for `Node.scratch`.
+"""
+from itertools import product
+
+EMPTY, X, O = 0, 1, 2
+NR_CODES = 3**9
+POWERS = tuple(3**i for i in range(9))
+# Rows, columns, then both diagonals. On impossible boards with two
+# winners, the first complete line decides.
+LINES = (
+    (0, 1, 2),
+    (3, 4, 5),
+    (6, 7, 8),
+    (0, 3, 6),
+    (1, 4, 7),
+    (2, 5, 8),
+    (0, 4, 8),
+    (2, 4, 6),
+)
+
+
+def cells_of(code):
+    "The 9 cell values (EMPTY, X or O) of `code`"
+    cells = []
+    for _ in range(9):
+        code, value = divmod(code, 3)
+        cells.append(value)
+    return cells
+
+
+def _winner(cells):
+    for i1, i2, i3 in LINES:
+        value = cells[i1]
+        if value != EMPTY and value == cells[i2] == cells[i3]:
+            return value == X
+    return None
+
+
+def _build():
+    winner, terminal, free, moves = [], [], [], []
+    children = ([], [])
+    for code in range(NR_CODES):
+        cells = cells_of(code)
+        won = _winner(cells)
+        empty = tuple(i for i, value in enumerate(cells) if value == EMPTY)
+        over = won is not None or not empty
+        winner.append(won)
+        terminal.append(over)
+        free.append(empty)
+        moves.append(() if over else empty)
+        for turn, piece in ((False, O), (True, X)):
+            children[turn].append(tuple(code + piece * POWERS[i] for i in empty))
+    tables = winner, terminal, free, moves, *children
+    return [tuple(table) for table in tables]
+
+
+WINNER, TERMINAL, FREE, MOVES, _O_CHILDREN, _X_CHILDREN = _build()
+CHILDREN = (_O_CHILDREN, _X_CHILDREN)
+
+_VALUE = {None: EMPTY, True: X, False: O}
+CODES = {
+    values: sum(_VALUE[value] * power for value, power in zip(values, POWERS))
+    for values in product((None, True, False), repeat=9)
+}
+
+
+class TicTacToeScratch:
+    """
+    Mutable position as a code and the player to move, see `Node.scratch`.
+    Moves are cell indices. `to_node` calls `make_node(code, turn)`.
+    """
+
+    def __init__(self, code, turn, make_node):
+        self.code = code
+        self.turn = turn
+        self.make_node = make_node
+
+    def legal_moves(self):
+        return MOVES[self.code]
+
+    def apply_move(self, i):
+        self.code += (X if self.turn else O) * POWERS[i]
+        self.turn = not self.turn
+
+    def undo_move(self, i):
+        self.turn = not self.turn
+        self.code -= (X if self.turn else O) * POWERS[i]
+
+    def is_terminal(self):
+        return TERMINAL[self.code]
+
+    def reward(self):
+        winner = WINNER[self.code]
+        if winner is None:
+            return 0.5
+        return 1 if winner else 0
+
+    def to_node(self):
+        return self.make_node(self.code, self.turn)
@@ -0,0 +1,245 @@
+"""
+Compact binary snapshots of an `MCTS` search tree.
+
+`save_tree` writes the tree to one file made of fixed-width sections:
+
+    header   magic, version, sizes, exploration weight and the node type
+    records  one 40-byte record per node: Q, N, proven value (NaN if none),
+             offset of its children in the child table and their number
+    states   one `node.encode()` per node, all of the same width
+    children the child ids of all expanded nodes, as uint32
+    index    open-addressing hash table from the CRC-32 of a state to its id
+
+`load_tree` memory-maps the file and returns a `TreeSnapshot`, which reads
+records on demand, so opening a multi-gigabyte tree costs nothing up front
+and only the pages that are looked at are read from disk. Node ids are only
+meaningful within one file.
+
+Any node type whose `encode` returns bytes of a fixed length, with a
+matching `decode`, can be saved, e.g. `connectfour.ConnectFourGame`,
+`connectfour.BitboardConnectFour` and both `TicTacToeBoard` classes.
+"""
+from array import array
+import math
+import mmap
+import struct
+import sys
+import zlib
+
+from monte_carlo_tree_search import MCTS
+
+MAGIC = b"MCTSTREE"
+VERSION = 1
+HEADER = struct.Struct("<8sIIQQQd64s")
+RECORD = struct.Struct("<dqdQI4x")
+UNEXPANDED = 2**64 - 1  # child offset of nodes that were never expanded
+EMPTY_SLOT = 2**32 - 1
+
+
+def _type_name(node_type):
+    return f"{node_type.__module__}.{node_type.__qualname__}"
+
+
+def _encode(node):
+    data = node.encode()
+    if data is None:
+        raise ValueError(f"{type(node).__name__} does not support encode")
+    return data
+
+
+def save_tree(tree, path):
+    "Write the nodes and statistics of `tree` (an `MCTS`) to `path`"
+    nodes = list(tree.N)
+    ids = {node: i for i, node in enumerate(nodes)}
+    for extra in (tree.children, tree.terminal):
+        for node in extra:
+            if node not in ids:
+                ids[node] = len(nodes)
+                nodes.append(node)
+    for children in list(tree.children.values()):
+        for child in children:
+            if child not in ids:
+                ids[child] = len(nodes)
+                nodes.append(child)
+    if not nodes:
+        raise ValueError("cannot save an empty tree")
+    if len(nodes) >= EMPTY_SLOT:
+        raise ValueError(f"too many nodes to save: {len(nodes)}")
+
+    states = [_encode(node) for node in nodes]
+    state_size = len(states[0])
+    if any(len(state) != state_size for state in states):
+        raise ValueError("node encodings must all have the same length")
+    node_type = type(nodes[0])
+
+    edges = array("I")
+    slots = 1
+    while slots < 2 * len(nodes):
+        slots *= 2
+    index = array("I", [EMPTY_SLOT]) * slots
+    with open(path, "wb") as f:
+        f.write(
+            HEADER.pack(
+                MAGIC,
+                VERSION,
+                state_size,
+                len(nodes),
+                sum(len(children) for children in tree.children.values()),
+                slots,
+                tree.exploration_weight,
+                _type_name(node_type).encode("utf-8"),
+            )
+        )
+        for node in nodes:
+            children = tree.children.get(node)
+            start = UNEXPANDED if children is None else len(edges)
+            if children is not None:
+                edges.extend(ids[child] for child in children)
+            f.write(
+                RECORD.pack(
+                    tree.Q.get(node, 0),
+                    tree.N.get(node, 0),
+                    tree.terminal.get(node, math.nan),
+                    start,
+                    0 if children is None else len(children),
+                )
+            )
+        for i, state in enumerate(states):
+            f.write(state)
+            slot = zlib.crc32(state) & (slots - 1)
+            while index[slot] != EMPTY_SLOT:
+                slot = (slot + 1) & (slots - 1)
+            index[slot] = i
+        if sys.byteorder == "big":
+            edges.byteswap()
+            index.byteswap()
+        f.write(edges.tobytes())
+        f.write(index.tobytes())
+
+
+def load_tree(path, node_type):
+    "Memory-map the tree saved at `path`, whose nodes are `node_type`"
+    return TreeSnapshot(path, node_type)
+
+
+class TreeSnapshot:
+    "Read-only view of a saved tree, with the same `choose` as `MCTS`"
+
+    def __init__(self, path, node_type):
+        self.node_type = node_type
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (
+            magic,
+            version,
+            self.state_size,
+            self.node_count,
+            self.edge_count,
+            self.index_slots,
+            self.exploration_weight,
+            type_name,
+        ) = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"{path} is not a version {VERSION} tree snapshot")
+        type_name = type_name.rstrip(b"\0").decode("utf-8")
+        if type_name != _type_name(node_type):
+            self.close()
+            raise ValueError(f"{path} holds {type_name} nodes, not {_type_name(node_type)}")
+        self._records = HEADER.size
+        self._states = self._records + self.node_count * RECORD.size
+        self._edges = self._states + self.node_count * self.state_size
+        self._index = self._edges + 4 * self.edge_count
+
+    def __len__(self):
+        return self.node_count
+
+    def node(self, i):
+        "The node with id `i`"
+        start = self._states + i * self.state_size
+        return self.node_type.decode(self._map[start : start + self.state_size])
+
+    def find(self, node):
+        "Id of `node`, None if it is not in the tree"
+        state = _encode(node)
+        mask = self.index_slots - 1
+        slot = zlib.crc32(state) & mask
+        while True:
+            (i,) = struct.unpack_from("<I", self._map, self._index + 4 * slot)
+            if i == EMPTY_SLOT:
+                return None
+            start = self._states + i * self.state_size
+            if self._map[start : start + self.state_size] == state:
+                return i
+            slot = (slot + 1) & mask
+
+    def record(self, i):
+        "(Q, N, proven value or None, child ids or None if unexpanded) of node `i`"
+        Q, N, proven, start, count = RECORD.unpack_from(
+            self._map, self._records + i * RECORD.size
+        )
+        children = None
+        if start != UNEXPANDED:
+            children = struct.unpack_from(f"<{count}I", self._map, self._edges + 4 * start)
+        return Q, N, (None if math.isnan(proven) else proven), children
+
+    def stats(self, node):
+        "(total reward, visit count, proven value or None) of `node`"
+        i = self.find(node)
+        if i is None:
+            return 0, 0, None
+        return self.record(i)[:3]
+
+    def children(self, node):
+        "Children of `node` in the tree, None if it was not expanded"
+        i = self.find(node)
+        if i is None:
+            return None
+        children = self.record(i)[3]
+        if children is None:
+            return None
+        return [self.node(child) for child in children]
+
+    def _score(self, i, turn):
+        Q, N, proven, _ = self.record(i)
+        if proven is not None:
+            return proven
+        if N == 0:
+            return float("-inf") if turn else float("inf")
+        return Q / N if turn else 1 - Q / N
+
+    def choose(self, node):
+        "Choose the best successor of node, by the same rule as `MCTS.choose`"
+        if node.is_terminal():
+            raise RuntimeError(f"choose called on terminal node {node}")
+        i = self.find(node)
+        children = None if i is None else self.record(i)[3]
+        if not children:
+            return node.find_random_child()
+        pick = min if node.turn else max
+        return self.node(pick(children, key=lambda c: self._score(c, not node.turn)))
+
+    def to_mcts(self):
+        "Load the whole tree into a new `MCTS`"
+        tree = MCTS(self.exploration_weight)
+        nodes = [self.node(i) for i in range(self.node_count)]
+        for i, node in enumerate(nodes):
+            Q, N, proven, children = self.record(i)
+            if N or Q:
+                tree.Q[node] = Q
+                tree.N[node] = N
+            if proven is not None:
+                tree.terminal[node] = proven
+            if children is not None:
+                tree.children[node] = {nodes[c] for c in children}
+                tree._child_entries += len(children)
+        return tree
+
+    def close(self):
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,24 @@
+"""
+Zobrist keys for grid games.
+
+Every (square, piece) pair gets a fixed random 64-bit number and the key of
+a board is the XOR of the numbers of its occupied squares. Placing a piece
+is then a single XOR, so a child's key is derived from its parent's key
+instead of being rebuilt from the whole board.
+"""
+import random
+
+
+def zobrist_table(nr_squares, pieces, seed=0):
+    "Random 64-bit numbers, indexed as table[square][piece]"
+    rng = random.Random(seed)
+    return [{piece: rng.getrandbits(64) for piece in pieces} for _ in range(nr_squares)]
+
+
+def zobrist_key(table, cells, empty=" "):
+    "Full key of a board given as a flat iterable of cells"
+    key = 0
+    for square, piece in enumerate(cells):
+        if piece != empty:
+            key ^= table[square][piece]
+    return key